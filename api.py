@@ -0,0 +1,204 @@
+# ----------------------------------------------------------------------------#
+# JSON API, version 1.
+# ----------------------------------------------------------------------------#
+#
+#   GET /api/v1/<venues|artists|shows>                  page or cursor pagination
+#   GET /api/v1/<venues|artists|shows>/<id>
+#   GET /api/v1/<venues|artists|shows>/batch?ids=1,2,3  one query for up to API_BATCH_LIMIT ids
+#
+# Every endpoint takes ?fields=a,b,c and only those columns are read, so a
+# client asking for ids and names never pays for the rest of the row.
+
+import datetime
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from models import Artist, Show, Venue, db
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+FIELDS = {
+    'venues': ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link', 'genres',
+               'website', 'seeking_talent', 'seeking_description', 'num_upcoming_shows', 'num_past_shows'],
+    'artists': ['id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'genres', 'website',
+                'seeking_venue', 'seeking_description', 'num_upcoming_shows', 'num_past_shows'],
+    'shows': ['id', 'start_time', 'venue_id', 'venue_name', 'venue_image_link',
+              'artist_id', 'artist_name', 'artist_image_link'],
+}
+
+# Only on single venues and artists, where they cost one extra query.
+SHOW_LIST_FIELDS = ['past_shows', 'upcoming_shows']
+
+
+# Handlers registered for a status code take precedence over class-based
+# ones, so 404 is listed too or the app's HTML 404 page would win.
+@api.errorhandler(404)
+@api.errorhandler(HTTPException)
+def api_error(error):
+    return jsonify({'error': error.description}), error.code
+
+
+def resource_columns(kind):
+    if kind == 'shows':
+        return {
+            'id': Show.id,
+            'start_time': Show.start_time,
+            'venue_id': Show.venue_id,
+            'venue_name': Venue.name,
+            'venue_image_link': Venue.image_link,
+            'artist_id': Show.artist_id,
+            'artist_name': Artist.name,
+            'artist_image_link': Artist.image_link,
+        }
+    model = Venue if kind == 'venues' else Artist
+    return {field: getattr(model, field) for field in FIELDS[kind]}
+
+
+def parse_fields(kind, single=False):
+    if not request.args.get('fields'):
+        return FIELDS[kind]
+
+    fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+    allowed = FIELDS[kind] + (SHOW_LIST_FIELDS if single and kind != 'shows' else [])
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, 'Unknown fields for %s: %s.' % (kind, ', '.join(unknown)))
+    return fields
+
+
+def select(kind, fields):
+    # The requested columns plus the sort key. A show's venue and artist are
+    # only joined when one of their fields was asked for.
+    columns = resource_columns(kind)
+    keys = ['start_time', 'id'] if kind == 'shows' else ['id']
+    names = keys + [field for field in fields if field in columns and field not in keys]
+    query = db.session.query(*[columns[name].label(name) for name in names])
+
+    if kind == 'shows':
+        query = query.select_from(Show).filter(Show.start_time.isnot(None))
+        if any(name.startswith('venue_') and name != 'venue_id' for name in names):
+            query = query.join(Venue, Venue.id == Show.venue_id)
+        if any(name.startswith('artist_') and name != 'artist_id' for name in names):
+            query = query.join(Artist, Artist.id == Show.artist_id)
+    return query
+
+
+def order(kind, query):
+    if kind == 'shows':
+        return query.order_by(Show.start_time.desc(), Show.id.desc())
+    return query.order_by(resource_columns(kind)['id'])
+
+
+def _json_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _json_value(item) for key, item in value.items()}
+    return value
+
+
+def _show_list(shows):
+    # get_shows() also returns the show id and the versions the page
+    # templates cache show tiles by; they stay out of the API.
+    return [{key: _json_value(value) for key, value in show.items() if key != 'id' and not key.endswith('updated_at')}
+            for show in shows]
+
+
+def serialize(row, fields):
+    row = row._asdict()
+    return {field: _json_value(row[field]) for field in fields if field in row}
+
+
+@api.route('/<any(venues, artists, shows):kind>')
+def list_resources(kind):
+    fields = parse_fields(kind)
+    per_page = min(request.args.get('per_page', current_app.config['API_PER_PAGE'], type=int),
+                   current_app.config['API_MAX_PER_PAGE'])
+    if per_page < 1:
+        abort(400, 'per_page must be positive.')
+    query = select(kind, fields)
+
+    # ?cursor= (empty for the first page) switches to keyset pagination,
+    # which stays fast however deep the client pages.
+    if 'cursor' in request.args:
+        cursor = request.args['cursor']
+        try:
+            if cursor and kind == 'shows':
+                query = query.filter(db.tuple_(Show.start_time, Show.id) < Show.decode_cursor(cursor))
+            elif cursor:
+                query = query.filter(resource_columns(kind)['id'] > int(cursor))
+        except ValueError:
+            abort(400, 'Invalid cursor.')
+
+        rows = order(kind, query).limit(per_page + 1).all()
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            last = rows[-1]._asdict()
+            next_cursor = Show.encode_cursor(last) if kind == 'shows' else str(last['id'])
+        return jsonify({
+            'data': [serialize(row, fields) for row in rows],
+            'next_cursor': next_cursor,
+        })
+
+    # Counted without the requested fields: a window count over a show page
+    # would have to join every show to its venue and artist. Counting first
+    # also spares walking the whole OFFSET for pages past the end.
+    page = max(request.args.get('page', 1, type=int), 1)
+    total = select(kind, ['id']).order_by(None).count()
+    rows = []
+    if (page - 1) * per_page < total:
+        rows = order(kind, query) \
+            .limit(per_page) \
+            .offset((page - 1) * per_page) \
+            .all()
+    return jsonify({
+        'data': [serialize(row, fields) for row in rows],
+        'page': page,
+        'per_page': per_page,
+        'pages': -(-total // per_page),
+        'total': total,
+    })
+
+
+@api.route('/<any(venues, artists, shows):kind>/batch')
+def batch_resources(kind):
+    try:
+        ids = [int(id) for id in request.args.get('ids', '').split(',') if id.strip()]
+    except ValueError:
+        abort(400, 'ids must be a comma separated list of integers.')
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        abort(400, 'No ids given.')
+    if len(ids) > current_app.config['API_BATCH_LIMIT']:
+        abort(400, 'At most %d ids per request.' % current_app.config['API_BATCH_LIMIT'])
+
+    fields = parse_fields(kind)
+    rows = select(kind, fields).filter(resource_columns(kind)['id'].in_(ids)).all()
+    found = {row.id: row for row in rows}
+    return jsonify({
+        'data': [serialize(found[id], fields) for id in ids if id in found],
+        'missing': [id for id in ids if id not in found],
+    })
+
+
+@api.route('/<any(venues, artists, shows):kind>/<int:id>')
+def get_resource(kind, id):
+    fields = parse_fields(kind, single=True)
+    row = select(kind, fields).filter(resource_columns(kind)['id'] == id).first()
+    if row is None:
+        abort(404, 'No such %s.' % kind[:-1])
+
+    data = serialize(row, fields)
+    if any(field in SHOW_LIST_FIELDS for field in fields):
+        # get_shows() only needs the id, so skip loading the full row.
+        model = Venue if kind == 'venues' else Artist
+        past_shows, upcoming_shows = model(id=id).get_shows()
+        if 'past_shows' in fields:
+            data['past_shows'] = _show_list(past_shows)
+        if 'upcoming_shows' in fields:
+            data['upcoming_shows'] = _show_list(upcoming_shows)
+    return jsonify(data)
@@ -2,155 +2,229 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
-import json
+import click
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+import babel.dates
+import functools
+import time
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, \
+    stream_with_context, current_app
+from flask.cli import with_appcontext
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
-from flask_migrate import Migrate
+from forms import ArtistForm, Genre, ShowForm, VenueForm
+from cache import conditional
+from database import init_engine, pool_stats
+from api import api
+from assets import build_assets
+from exporter import MIMETYPES, export_rows
+from extensions import (assets, compression, db, fragment_cache, metrics, moment, page_cache, query_cache,
+                        query_instrumentation, slow_query_log)
+from importer import import_file
+from models import Artist, Show, Venue, artist_validator, artists_validator, genre_counts, genre_filter, \
+    reconcile_show_counts, rollover_show_counts, search_by_name, shows_validator, venue_validator, venues_validator
+from templating import init_templates, warm_templates
 
 import sys
 
-# from models import Artist, Venue, Show
-
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# Views and error handlers are collected as this module is imported and added
+# by create_app(). They go onto the app itself rather than a blueprint so
+# endpoint names, which templates, QUERY_BUDGETS and metric labels use, stay
+# unprefixed.
+_routes = []
+_error_handlers = []
+
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+
+    return decorator
+
+
+def errorhandler(code):
+    def decorator(handler):
+        _error_handlers.append((code, handler))
+        return handler
+
+    return decorator
+
+
+def create_app(config=None):
+    """Build the app; ``config`` overrides settings from config.py."""
+    app = Flask(__name__)
+    app.config.from_object('config')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
+
+    moment.init_app(app)
+    db.init_app(app)
+    query_instrumentation.init_app(app)
+    slow_query_log.init_app(app)
+    init_engine(app, db)
+    page_cache.init_app(app)
+    query_cache.init_app(app, db)
+    fragment_cache.init_app(app)
+    metrics.init_app(app)
+    # After metrics, so its after_request runs first and the latency
+    # metric includes compressing.
+    compression.init_app(app)
+
+    # Flask-Migrate brings in alembic and mako, a third of the import time,
+    # and only the `flask db` commands use it, so apps built outside the
+    # flask CLI go without.
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    app.jinja_env.filters['datetime'] = format_datetime
+    init_templates(app)
+    assets.init_app(app)
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for code, handler in _error_handlers:
+        app.register_error_handler(code, handler)
+    app.register_blueprint(api)
+    for command in (rollover_shows_command, reconcile_show_counts_command, import_command, warm_templates_command,
+                    build_assets_command):
+        app.cli.add_command(command)
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    if app.config['TEMPLATE_WARMUP']:
+        started = time.perf_counter()
+        timings = warm_templates(app)
+        app.logger.info('Warmed %d templates in %.1f ms', len(timings), (time.perf_counter() - started) * 1000)
+        for name, loaded, rendered, error in timings:
+            if error:
+                app.logger.warning('Template %s did not render with sample data: %s', name, error)
+
+    return app
 
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@functools.lru_cache(maxsize=64)
+def datetime_pattern(format, locale=None):
+    # Parsing the pattern and the locale dominates babel's format_datetime,
+    # so both are done once per (format, locale).
+    pattern = babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+    return pattern, babel.Locale.parse(locale or babel.dates.LC_TIME)
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+def format_datetime(value, format='medium', locale=None):
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    pattern, locale = datetime_pattern(format, locale)
+    return pattern.apply(value, locale)
 
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
-@app.route('/')
+@route('/')
 def index():
     return render_template('pages/home.html')
 
 
+def genre_facets(model, endpoint):
+    """Read ?genre=...&match=any|all and count each genre for the sidebar.
+
+    Returns (genres, match, facets). Each facet links to the list with that
+    genre toggled; genres no listed row has are left out unless selected.
+    """
+    genres = request.args.getlist('genre')
+    match = request.args.get('match', 'all')
+    if match not in ('all', 'any') or any(genre not in Genre.__members__ for genre in genres):
+        abort(400)
+    genres = tuple(dict.fromkeys(genres))
+
+    counts = genre_counts(model, genres, match)
+    facets = []
+    for name, genre in Genre.__members__.items():
+        selected = name in genres
+        if not counts.get(name) and not selected:
+            continue
+        toggled = [other for other in genres if other != name] if selected else list(genres) + [name]
+        facets.append({
+            'name': name,
+            'label': genre.value,
+            'count': counts.get(name, 0),
+            'selected': selected,
+            'url': url_for(endpoint, genre=toggled, match=match if match != 'all' and toggled else None),
+        })
+    return genres, match, facets
+
+
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@route('/venues')
+@conditional(venues_validator)
+@page_cache.cached('venues')
 def venues():
-    from models import Venue
-
     # Done: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-    areas = Venue.query.distinct('city', 'state').all()
+    genres, match, facets = genre_facets(Venue, 'venues')
+    data = Venue.get_areas(genres, match)
 
-    data = []
-
-    for area in areas:
-        venues = Venue.query.filter(Venue.city == area.city, Venue.state == area.state).all()
-        record = {
-            'city': area.city,
-            'state': area.state,
-            'venues': [venue.get_venue() for venue in venues],
-        }
-        data.append(record)
-
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=data, genres=genres, match=match, facets=facets)
 
 
-@app.route('/venues/search', methods=['POST'])
+@route('/venues/search', methods=['POST'])
 def search_venues():
-    from models import Venue
     # Done: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
     search = request.form.get('search_term', '')
-    venues = Venue.query.filter(Venue.name.ilike("%" + search + "%")).all()
-
-    data = []
-    for venue in venues:
-        data.append(venue.search)
-
-    response = {
-        "count": len(venues),
-        "data": data
-    }
+    page = request.form.get('page', 1, type=int)
+    response = search_by_name(Venue, search, page, current_app.config['SEARCH_RESULTS_PER_PAGE'])
 
     return render_template('pages/search_venues.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
-@app.route('/venues/<int:venue_id>')
+@route('/venues/<int:venue_id>')
+@conditional(venue_validator)
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
-    from models import Artist, Venue, Show, db
-    from forms import Genre
     # shows the venue page with the given venue_id
     # Done: replace with real venue data from the venues table, using venue_id
 
-    past_shows = []
-    upcoming_shows = []
-    now = datetime.now()
-
     venue = Venue.query.filter_by(id=venue_id).first_or_404()
+    past_shows, upcoming_shows = venue.get_shows()
+    page_cache.tag(*('artist:%d' % show['artist_id'] for show in past_shows + upcoming_shows))
 
     genreList = []
 
     for genre in venue.genres:
         genreList.append(Genre[genre])
 
-    past_shows_query = db.session.query(Show, Artist) \
-        .filter(Show.venue_id == venue.id) \
-        .filter(Show.start_time < now) \
-        .filter(Artist.id == Show.artist_id) \
-        .all()
-
-    for s, a in past_shows_query:
-        past_shows.extend([{
-            "artist_id": a.id,
-            "artist_name": a.name,
-            "artist_image_link": a.image_link,
-            "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
-        }])
-
-    upcoming_shows_query = db.session.query(Show, Artist) \
-        .filter(Show.venue_id == venue.id) \
-        .filter(Show.start_time > now) \
-        .filter(Artist.id == Show.artist_id) \
-        .all()
-
-    for s, a in upcoming_shows_query:
-        upcoming_shows.extend([{
-            "artist_id": a.id,
-            "artist_name": a.name,
-            "artist_image_link": a.image_link,
-            "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
-        }])
-
     data = {
         "id": venue.id,
         "name": venue.name,
@@ -166,8 +240,8 @@ def show_venue(venue_id):
         "image_link": venue.image_link,
         "past_shows": past_shows,
         "upcoming_shows": upcoming_shows,
-        "past_shows_count": venue.get_past_shows_count(),
-        "upcoming_shows_count": venue.get_upcoming_shows_count(),
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
     }
 
     return render_template('pages/show_venue.html', venue=data)
@@ -176,16 +250,14 @@ def show_venue(venue_id):
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@route('/venues/create', methods=['POST'])
 def create_venue_submission():
-    from models import Venue, db
-    from forms import Genre
     # Done: insert form data as a new Venue record in the db, instead
     # Done: modify data to be the data object returned from db insertion
 
@@ -210,6 +282,7 @@ def create_venue_submission():
 
             db.session.add(venue)
             db.session.commit()
+            page_cache.invalidate('venues')
             flash('Venue ' + request.form['name'] + ' was successfully listed!')
         except:
             error = True
@@ -232,16 +305,20 @@ def create_venue_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-    from models import Venue, db
     # Done: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
 
     error = False
     try:
-        Venue.query.filter_by(id=venue_id).delete()
+        # Delete through the session so the venue's shows cascade and keep
+        # the artists' show counters in step.
+        venue = Venue.query.get(venue_id)
+        if venue is not None:
+            db.session.delete(venue)
         db.session.commit()
+        page_cache.invalidate('venues', 'venue:%s' % venue_id, 'shows')
     except:
         error = True
         db.session.rollback()
@@ -259,82 +336,47 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@route('/artists')
+@conditional(artists_validator)
+@page_cache.cached('artists')
 def artists():
-    from models import Artist
-
-    data = Artist.query.order_by('id').all()
-    return render_template('pages/artists.html', artists=data)
+    genres, match, facets = genre_facets(Artist, 'artists')
+    query = Artist.query
+    if genres:
+        query = query.filter(genre_filter(Artist, genres, match))
+    data = query.order_by('id').all()
+    return render_template('pages/artists.html', artists=data, genres=genres, match=match, facets=facets)
 
 
-@app.route('/artists/search', methods=['POST'])
+@route('/artists/search', methods=['POST'])
 def search_artists():
-    from models import Artist
     # Done: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
     search = request.form.get('search_term', '')
-    artists = Artist.query.filter(Artist.name.ilike("%" + search + "%")).all()
-
-    data = []
-    for artist in artists:
-        data.append(artist.search)
-
-    response = {
-        "count": len(artists),
-        "data": data
-    }
+    page = request.form.get('page', 1, type=int)
+    response = search_by_name(Artist, search, page, current_app.config['SEARCH_RESULTS_PER_PAGE'])
 
     return render_template('pages/search_artists.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
-@app.route('/artists/<int:artist_id>')
+@route('/artists/<int:artist_id>')
+@conditional(artist_validator)
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
-    from models import Artist, Venue, Show, db
-    from forms import Genre
     # shows the venue page with the given venue_id
     # Done: replace with real venue data from the venues table, using venue_id
-    past_shows = []
-    upcoming_shows = []
-    now = datetime.now()
-
     artist = Artist.query.filter_by(id=artist_id).first_or_404()
+    past_shows, upcoming_shows = artist.get_shows()
+    page_cache.tag(*('venue:%d' % show['venue_id'] for show in past_shows + upcoming_shows))
 
     genreList = []
 
     for genre in artist.genres:
         genreList.append(Genre[genre])
 
-    past_shows_query = db.session.query(Show, Venue) \
-        .filter(Show.artist_id == artist.id) \
-        .filter(Show.start_time < now) \
-        .filter(Venue.id == Show.venue_id) \
-        .all()
-
-    for s, v in past_shows_query:
-        past_shows.extend([{
-            "venue_id": v.id,
-            "venue_name": v.name,
-            "venue_image_link": v.image_link,
-            "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
-        }])
-
-    upcoming_shows_query = db.session.query(Show, Venue) \
-        .filter(Show.artist_id == artist.id) \
-        .filter(Show.start_time > now) \
-        .filter(Venue.id == Show.venue_id) \
-        .all()
-
-    for s, v in upcoming_shows_query:
-        upcoming_shows.extend([{
-            "venue_id": v.id,
-            "venue_name": v.name,
-            "venue_image_link": v.image_link,
-            "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
-        }])
-
     data = {
         "id": artist.id,
         "name": artist.name,
@@ -349,8 +391,8 @@ def show_artist(artist_id):
         "image_link": artist.image_link,
         "past_shows": past_shows,
         "upcoming_shows": upcoming_shows,
-        "past_shows_count": artist.get_past_shows_count(),
-        "upcoming_shows_count": artist.get_upcoming_shows_count(),
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
     }
 
     return render_template('pages/show_artist.html', artist=data)
@@ -358,10 +400,8 @@ def show_artist(artist_id):
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-    from models import Artist
-
     artist = Artist.query.filter_by(id=artist_id).first_or_404()
     form = ArtistForm(obj=artist)
 
@@ -369,9 +409,8 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-    from models import Artist
     # Done: take values from the form submitted, and update existing
     # artist record with ID <artist_id> using the new attributes
 
@@ -393,6 +432,7 @@ def edit_artist_submission(artist_id):
             artist.seeking_venue = form.seeking_venue.data
             artist.seeking_description = form.seeking_description.data
             db.session.commit()
+            page_cache.invalidate('artists', 'artist:%d' % artist_id)
             flash('Artist ' + request.form['name'] + ' was successfully updated!')
         except:
             error = True
@@ -415,10 +455,8 @@ def edit_artist_submission(artist_id):
     return redirect(url_for('show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-    from models import Venue
-
     venue = Venue.query.filter_by(id=venue_id).first_or_404()
     form = VenueForm(obj=venue)
 
@@ -426,9 +464,8 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-    from models import Venue
     # Done: take values from the form submitted, and update existing
     # venue record with ID <venue_id> using the new attributes
 
@@ -450,6 +487,7 @@ def edit_venue_submission(venue_id):
             venue.seeking_talent = form.seeking_talent.data
             venue.seeking_description = form.seeking_description.data
             db.session.commit()
+            page_cache.invalidate('venues', 'venue:%d' % venue_id)
             flash('Venue ' + request.form['name'] + ' was successfully updated!')
         except:
             error = True
@@ -475,15 +513,14 @@ def edit_venue_submission(venue_id):
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@route('/artists/create', methods=['POST'])
 def create_artist_submission():
-    from models import Artist, db
     # called upon submitting the new artist listing form
     # Done: insert form data as a new Venue record in the db, instead
     # Done: modify data to be the data object returned from db insertion
@@ -508,6 +545,7 @@ def create_artist_submission():
 
             db.session.add(artist)
             db.session.commit()
+            page_cache.invalidate('artists')
             flash('Artist ' + request.form['name'] + ' was successfully listed!')
         except:
             error = True
@@ -538,43 +576,51 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 
-@app.route('/shows')
+@route('/shows')
+@conditional(shows_validator)
+@page_cache.cached('shows')
 def shows():
-    from models import Artist, Venue, Show, db
     # displays list of shows at /shows
     # Done: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
-    data = []
-
-    shows = db.session.query(Show, Venue, Artist) \
-        .filter(Show.venue_id == Venue.id) \
-        .filter(Show.artist_id == Artist.id) \
-        .order_by(Show.start_time.desc()) \
-        .all()
+    try:
+        after = request.args.get('after')
+        before = request.args.get('before')
+        page = Show.get_page(after=Show.decode_cursor(after) if after else None,
+                             before=Show.decode_cursor(before) if before else None,
+                             per_page=current_app.config['SHOWS_PER_PAGE'])
+    except ValueError:
+        abort(400)
 
-    for s, v, a in shows:
+    data = []
+    for show in page['shows']:
+        page_cache.tag('venue:%d' % show['venue_id'], 'artist:%d' % show['artist_id'])
         data.extend([{
-            "venue_id": v.id,
-            "venue_name": v.name,
-            "artist_id": a.id,
-            "artist_name": a.name,
-            "artist_image_link": a.image_link,
-            "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
+            "id": show['id'],
+            "venue_id": show['venue_id'],
+            "venue_name": show['venue_name'],
+            "artist_id": show['artist_id'],
+            "artist_name": show['artist_name'],
+            "artist_image_link": show['artist_image_link'],
+            "start_time": show['start_time'],
+            "updated_at": show['updated_at'],
+            "venue_updated_at": show['venue_updated_at'],
+            "artist_updated_at": show['artist_updated_at'],
         }])
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=data,
+                           next_cursor=page['next_cursor'], prev_cursor=page['prev_cursor'])
 
 
-@app.route('/shows/create')
+@route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@route('/shows/create', methods=['POST'])
 def create_show_submission():
-    from models import Show, db
     # called to create new shows in the db, upon submitting new show listing form
     # Done: insert form data as a new Show record in the db, instead
     error = False
@@ -582,12 +628,13 @@ def create_show_submission():
     if form.validate():
         try:
             show = Show()
-            show.artist_id = form.artist_id.data,
-            show.venue_id = form.venue_id.data,
+            show.artist_id = form.artist_id.data
+            show.venue_id = form.venue_id.data
             show.start_time = form.start_time.data
 
             db.session.add(show)
             db.session.commit()
+            page_cache.invalidate('shows', 'venue:%s' % form.venue_id.data, 'artist:%s' % form.artist_id.data)
             flash('Show was successfully listed!')
         except:
             error = True
@@ -614,25 +661,134 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
-@app.errorhandler(404)
+#  Exports
+#  ----------------------------------------------------------------
+
+@route('/<any(venues, artists, shows):kind>/export.<any(csv, ndjson):file_format>')
+def export(kind, file_format):
+    # ?from=&to= bound show start times (to is exclusive); ?venue_id= and
+    # ?artist_id= narrow to one venue or artist.
+    try:
+        start = dateutil.parser.parse(request.args['from']) if request.args.get('from') else None
+        end = dateutil.parser.parse(request.args['to']) if request.args.get('to') else None
+    except (ValueError, OverflowError):
+        abort(400)
+
+    rows = export_rows(db, kind, file_format, chunk_size=current_app.config['EXPORT_CHUNK_SIZE'],
+                       start=start, end=end,
+                       venue_id=request.args.get('venue_id', type=int),
+                       artist_id=request.args.get('artist_id', type=int))
+    response = Response(stream_with_context(rows), mimetype=MIMETYPES[file_format])
+    response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, file_format)
+    return response
+
+
+@route('/cache/stats')
+def cache_stats():
+    return jsonify({
+        'pages': page_cache.stats(),
+        'queries': query_cache.stats(),
+        'fragments': fragment_cache.stats(),
+    })
+
+
+@route('/pool/stats')
+def connection_pool_stats():
+    return jsonify(pool_stats.snapshot(db.engine.pool))
+
+
+@route('/metrics')
+def prometheus_metrics():
+    return metrics.response()
+
+
+@errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+@click.command('rollover-shows')
+@with_appcontext
+def rollover_shows_command():
+    """Move shows that have started from the upcoming to the past counters."""
+    started = rollover_show_counts()
+    click.echo(f'Rolled over {started} started show(s).')
+
+
+@click.command('reconcile-show-counts')
+@with_appcontext
+def reconcile_show_counts_command():
+    """Recompute every venue and artist show counter from the Show table."""
+    reconcile_show_counts()
+    click.echo('Show counters reconciled.')
+
+
+@click.command('warm-templates')
+@with_appcontext
+def warm_templates_command():
+    """Compile and render every template, and print how long each took."""
+    app = current_app._get_current_object()
+    app.jinja_env.cache.clear()
+    timings = warm_templates(app)
+
+    click.echo('%-30s %9s %10s' % ('template', 'load ms', 'render ms'))
+    for name, loaded, rendered, error in timings:
+        click.echo('%-30s %9.2f %10s' % (name, loaded * 1000, '%.2f' % (rendered * 1000) if error is None else error))
+    click.echo('%-30s %9.2f %10.2f' % ('total', sum(timing[1] for timing in timings) * 1000,
+                                       sum(timing[2] or 0 for timing in timings) * 1000))
+
+
+@click.command('build-assets')
+@with_appcontext
+@click.option('--no-compress', is_flag=True, help='Skip the gzip and brotli copies.')
+def build_assets_command(no_compress):
+    """Bundle and fingerprint the layouts' CSS and JS into static/dist."""
+    built = build_assets(current_app.static_folder, compress=not no_compress)
+
+    click.echo('%-14s %-28s %9s %9s %9s' % ('bundle', 'file', 'bytes', 'gzip', 'brotli'))
+    for name, filename, size, gzipped, brotlied in built:
+        click.echo('%-14s %-28s %9d %9s %9s' % (name, filename, size, gzipped or '-', brotlied or '-'))
+    if not no_compress and all(row[4] is None for row in built):
+        click.echo('Install brotli to also write .br copies.')
+    click.echo('Restart the app to link the new bundles.')
+
+
+@click.command('import')
+@with_appcontext
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per INSERT/COPY and transaction.')
+@click.option('--copy', 'use_copy', is_flag=True, help='Load with COPY instead of multi-row INSERTs.')
+@click.option('--rejects', type=click.File('w', encoding='utf-8', lazy=True),
+              help='Where to write rejected rows as NDJSON [default: <source>.rejects.ndjson].')
+def import_command(kind, source, file_format, batch_size, use_copy, rejects):
+    """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+    if file_format is None:
+        file_format = 'csv' if source.name.endswith('.csv') else 'ndjson'
+    if rejects is None:
+        name = 'stdin' if source.name == '<stdin>' else source.name
+        rejects = click.open_file(name + '.rejects.ndjson', 'w', encoding='utf-8', lazy=True)
+
+    loaded, rejected = import_file(db, kind, source, file_format, batch_size=batch_size,
+                                   use_copy=use_copy, rejects=rejects)
+    rejects.close()
+
+    click.echo(f'Imported {loaded} {kind}, rejected {rejected}.')
+    if rejected:
+        click.echo(f'Rejected rows were written to {rejects.name}.')
+
+
 
 # ----------------------------------------------------------------------------#
 # Launch.
@@ -640,11 +796,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,164 @@
+# ----------------------------------------------------------------------------#
+# Static asset bundles.
+# ----------------------------------------------------------------------------#
+#
+# `flask build-assets` concatenates the layouts' stylesheets and scripts into
+# bundles, names each after a hash of its contents and writes gzip and, when
+# the brotli package is installed, brotli copies next to it in static/dist,
+# with a manifest.json mapping bundle names to files. A bundle's file name
+# changes whenever its contents do, so they are served with far-future
+# immutable headers and a browser never asks for one twice. Without a build,
+# or with ASSETS_BUNDLED off, the layouts link the source files as before.
+
+import gzip
+import hashlib
+import json
+import os
+
+from flask import abort, request, send_from_directory, url_for
+
+# Bundle name -> files under static/, in the order the layouts load them.
+# static/dist sits at the same depth as static/css, so the relative url()s in
+# the stylesheets still resolve.
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'form.css': [
+        'css/bootstrap.min.css',
+        'css/bootstrap-theme.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    'modernizr.js': ['js/libs/modernizr-2.8.2.min.js'],
+    'main.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+    'form.js': ['js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js', 'js/script.js'],
+    'respond.js': ['js/libs/respond-1.4.2.min.js'],
+    'jquery.js': ['js/libs/jquery-1.11.1.min.js'],
+}
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+MIMETYPES = {'.css': 'text/css', '.js': 'application/javascript'}
+# Preferred first.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def build_assets(static_folder, bundles=None, compress=True):
+    """Write every bundle and the manifest to static/dist.
+
+    Returns (name, file name, bytes, gzip bytes, brotli bytes) per bundle;
+    the compressed sizes are None when that copy was not written. Files from
+    earlier builds are left in place for pages still linking them.
+    """
+    output = os.path.join(static_folder, DIST)
+    os.makedirs(output, exist_ok=True)
+    brotli = _brotli() if compress else None
+
+    manifest, built = {}, []
+    for name, sources in (bundles or BUNDLES).items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source), 'rb') as f:
+                parts.append(f.read().rstrip())
+        # A script that ends without a semicolon must not run into the next.
+        separator = b';\n' if name.endswith('.js') else b'\n'
+        data = separator.join(parts) + b'\n'
+
+        stem, extension = os.path.splitext(name)
+        filename = '%s.%s%s' % (stem, hashlib.sha256(data).hexdigest()[:12], extension)
+        copies = {'': data}
+        if compress:
+            copies['.gz'] = gzip.compress(data, 9, mtime=0)
+        if brotli is not None:
+            copies['.br'] = brotli.compress(data, quality=11)
+        for suffix, content in copies.items():
+            _write(os.path.join(output, filename + suffix), content)
+
+        manifest[name] = {'file': filename, 'encodings': [suffix for suffix in copies if suffix]}
+        built.append((name, filename, len(data),
+                      len(copies['.gz']) if '.gz' in copies else None,
+                      len(copies['.br']) if '.br' in copies else None))
+
+    _write(os.path.join(output, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return built
+
+
+def _write(path, content):
+    # Written aside and renamed, so a running worker never serves half a file.
+    partial = path + '.tmp'
+    with open(partial, 'wb') as f:
+        f.write(content)
+    os.replace(partial, path)
+
+
+class Assets(object):
+    """Links the layouts to the built bundles and serves them.
+
+    Templates call ``asset_urls('main.css')``, which gives the one bundle
+    URL after a build and the source files' URLs otherwise.
+    """
+
+    def __init__(self, app=None):
+        self.bundles = BUNDLES
+        self.manifest = {}
+        self.encodings = {}
+        self.max_age = 365 * 24 * 3600
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_age = app.config.get('ASSETS_MAX_AGE', self.max_age)
+        self.directory = os.path.join(app.static_folder, DIST)
+        if app.config.get('ASSETS_BUNDLED', True):
+            self.load_manifest()
+        app.extensions['assets'] = self
+        app.add_url_rule(app.static_url_path + '/' + DIST + '/<path:filename>', 'assets', self.send)
+        app.jinja_env.globals['asset_urls'] = self.urls
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self.encodings = {entry['file']: entry['encodings'] for entry in self.manifest.values()}
+
+    def urls(self, name):
+        if name in self.manifest:
+            return [url_for('assets', filename=self.manifest[name]['file'])]
+        return [url_for('static', filename=source) for source in self.bundles[name]]
+
+    def send(self, filename):
+        mimetype = MIMETYPES.get(os.path.splitext(filename)[1])
+        if mimetype is None:
+            abort(404)
+        # Files from an earlier build are only served as they are.
+        encodings = self.encodings.get(filename, ())
+        for encoding, suffix in ENCODINGS:
+            if suffix in encodings and request.accept_encodings[encoding]:
+                response = send_from_directory(self.directory, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.directory, filename, mimetype=mimetype)
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % self.max_age
+        return response
@@ -0,0 +1,94 @@
+# ----------------------------------------------------------------------------#
+# Export throughput benchmark.
+# ----------------------------------------------------------------------------#
+#
+# Seeds a scratch database, then streams /shows/export.csv and .ndjson through
+# the WSGI app and reports rows/s, MB/s, time to first byte and how far peak
+# RSS rose. For comparison it then builds the same CSV the naive way, with
+# Query.all() and one string in memory.
+#
+#   $ python -m benchmarks.export --database-url postgresql://.../bench --shows 1000000
+
+import argparse
+import csv
+import io
+import resource
+import time
+
+from benchmarks.seed import add_arguments, configure, seed_from_args
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stream(app, path):
+    client = app.test_client()
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+
+    response = client.get(path, buffered=False)
+    size = lines = 0
+    first_byte = None
+    for chunk in response.response:
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    response.close()
+
+    return time.perf_counter() - started, first_byte, size, lines, peak_rss_mb() - baseline
+
+
+def materialize(db):
+    from exporter import EXPORT_COLUMNS, export_query
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    rows = export_query(db, 'shows').all()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS['shows'])
+    writer.writerows(rows)
+    size = len(buffer.getvalue().encode('utf-8'))
+    return time.perf_counter() - started, None, size, len(rows) + 1, peak_rss_mb() - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure streaming export throughput and memory.')
+    add_arguments(parser)
+    parser.set_defaults(shows=1000000)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already in the database')
+    parser.add_argument('--chunk-size', type=int, help='override EXPORT_CHUNK_SIZE')
+    args = parser.parse_args()
+
+    app, db = configure(args.database_url)
+    app.config['PAGE_CACHE_ENABLED'] = False
+    if args.chunk_size:
+        app.config['EXPORT_CHUNK_SIZE'] = args.chunk_size
+
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed_from_args(db, args)
+            print('Seeded %d shows in %.1fs' % (args.shows, time.perf_counter() - started))
+
+    results = [
+        ('stream csv', stream(app, '/shows/export.csv')),
+        ('stream ndjson', stream(app, '/shows/export.ndjson')),
+    ]
+    # Last, since the peak RSS it reaches would hide the streaming runs'.
+    with app.app_context():
+        results.append(('Query.all() csv', materialize(db)))
+
+    print('%-18s %9s %8s %11s %9s %8s %10s' % ('export', 'rows', 'time (s)', 'rows/s', 'MB/s', 'TTFB (ms)',
+                                               'peak RSS +MB'))
+    for name, (elapsed, first_byte, size, lines, rss) in results:
+        rows = lines - 1 if 'csv' in name else lines
+        print('%-18s %9d %8.2f %11.0f %9.1f %8s %10.1f' % (
+            name, rows, elapsed, rows / elapsed, size / elapsed / 1024 / 1024,
+            '%.1f' % (first_byte * 1000) if first_byte is not None else '-', rss))
+
+
+if __name__ == '__main__':
+    main()
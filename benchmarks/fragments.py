@@ -0,0 +1,111 @@
+# ----------------------------------------------------------------------------#
+# Fragment cache benchmark.
+# ----------------------------------------------------------------------------#
+#
+# Renders each page that caches its tiles with N synthetic tiles: with the
+# fragment cache off, cold (every tile rendered and stored), warm (every tile
+# from the cache) and warm with --changed of the entities edited since the
+# last render. No database is needed.
+#
+#   $ python -m benchmarks.fragments --tiles 5000
+
+import argparse
+import datetime
+import statistics
+import time
+
+from flask import render_template
+
+from benchmarks.render_shows import make_shows
+
+
+def make_pages(count):
+    """Return {page: (template, context, entities)}.
+
+    Each entity is a dict whose updated_at the changed case bumps.
+    """
+    shows = make_shows(count)
+    updated_at = datetime.datetime(2020, 1, 1)
+    venues, artists = {}, {}
+    for i, show in enumerate(shows):
+        show['id'] = i + 1
+        show['updated_at'] = updated_at
+        show['venue_image_link'] = 'https://picsum.photos/seed/v%d/300' % show['venue_id']
+        show['venue_updated_at'] = show['artist_updated_at'] = updated_at
+
+    half = count // 2
+    venue = {
+        'id': 1, 'name': 'Venue 1', 'genres': ['Jazz'], 'address': '1 Main St', 'city': 'New York', 'state': 'NY',
+        'phone': '', 'website': '', 'facebook_link': '', 'image_link': '', 'seeking_talent': False,
+        'past_shows': shows[:half], 'upcoming_shows': shows[half:],
+        'past_shows_count': half, 'upcoming_shows_count': count - half,
+    }
+    artist = dict(venue, name='Artist 1', seeking_venue=False)
+
+    for i in range(count):
+        venues[i] = {'id': i + 1, 'name': 'Venue %d' % (i + 1), 'num_upcoming_shows': i % 7,
+                     'updated_at': updated_at}
+        artists[i] = {'id': i + 1, 'name': 'Artist %d' % (i + 1), 'updated_at': updated_at}
+    areas = [{'city': 'City %d' % area, 'state': 'NY', 'venues': [venues[i] for i in range(area, count, 50)]}
+             for area in range(min(50, count))]
+
+    return {
+        'shows': ('pages/shows.html', {'shows': shows, 'next_cursor': 'next', 'prev_cursor': 'prev'}, shows),
+        'show_venue': ('pages/show_venue.html', {'venue': venue}, shows),
+        'show_artist': ('pages/show_artist.html', {'artist': artist}, shows),
+        'artists': ('pages/artists.html', {'artists': list(artists.values())}, list(artists.values())),
+        'venues': ('pages/venues.html', {'areas': areas}, list(venues.values())),
+    }
+
+
+def time_render(template, context, repeat, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        render_template(template, **context)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time tile pages with and without the fragment cache.')
+    parser.add_argument('--tiles', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--changed', type=float, default=0.01, help='share of entities edited between renders')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app({'TEMPLATE_WARMUP': False})
+    cache = app.extensions['fragment_cache']
+    cache.max_entries = max(cache.max_entries, args.tiles * 2)
+    step = max(int(1 / args.changed), 1) if args.changed else 0
+
+    print('%d tiles per page, median of %d renders, %.0f%% changed' % (args.tiles, args.repeat, args.changed * 100))
+    print('%-12s %10s %10s %10s %10s %10s' % ('page', 'off ms', 'cold ms', 'warm ms', 'changed ms', 'warm x'))
+    with app.test_request_context('/'):
+        for page, (template, context, entities) in make_pages(args.tiles).items():
+            cache.enabled = False
+            off = time_render(template, context, args.repeat)
+            cache.enabled = True
+            cold = time_render(template, context, args.repeat, before=cache.clear)
+            warm = time_render(template, context, args.repeat)
+
+            def edit():
+                # A different slice each time, so every render misses.
+                edit.round += 1
+                for entity in entities[edit.round % step::step] if step else ():
+                    for key in ('updated_at', 'venue_updated_at', 'artist_updated_at'):
+                        if key in entity:
+                            entity[key] += datetime.timedelta(seconds=1)
+            edit.round = 0
+            changed = time_render(template, context, args.repeat, before=edit)
+
+            print('%-12s %10.1f %10.1f %10.1f %10.1f %9.1fx' % (page, off, cold, warm, changed, off / warm))
+            cache.clear()
+
+
+if __name__ == '__main__':
+    main()
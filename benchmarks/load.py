@@ -0,0 +1,301 @@
+# ----------------------------------------------------------------------------#
+# Concurrent load test.
+# ----------------------------------------------------------------------------#
+#
+# Seeds a scratch database, starts the app on a threaded WSGI server in its
+# own process and has --concurrency client threads replay a mix of browsing,
+# profile views, searches and the occasional new show against it for
+# --duration seconds. Every --interval seconds it prints throughput, p50/p95/
+# p99 latency and the error rate for that window, then a per-route summary
+# and the server's connection pool counters.
+#
+#   $ python -m benchmarks.load --database-url postgresql://.../bench --concurrency 16 --duration 60
+#
+# The pool is sized by DB_POOL_SIZE / DB_MAX_OVERFLOW as usual. --url points
+# the clients at a server that is already running (gunicorn, say) instead.
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import socket
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+
+from benchmarks.routes import percentile
+from benchmarks.seed import add_arguments, configure, seed_from_args
+
+# Relative weights of each kind of request.
+MIX = {
+    'venues': 30,
+    'artists': 10,
+    'shows': 10,
+    'show_venue': 20,
+    'show_artist': 15,
+    'search_venues': 5,
+    'search_artists': 5,
+    'create_show_submission': 5,
+}
+
+
+def parse_mix(value):
+    mix = dict(MIX)
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in MIX:
+            raise argparse.ArgumentTypeError('unknown request %r, pick from %s' % (name, ', '.join(MIX)))
+        mix[name] = int(weight)
+    return mix
+
+
+def build_request(name, rnd, venues, artists):
+    """Return (method, path, form body) for one request of the given kind."""
+    if name in ('venues', 'artists', 'shows'):
+        return 'GET', '/' + name, None
+    if name == 'show_venue':
+        return 'GET', '/venues/%d' % rnd.randint(1, venues), None
+    if name == 'show_artist':
+        return 'GET', '/artists/%d' % rnd.randint(1, artists), None
+    if name == 'search_venues':
+        return 'POST', '/venues/search', {'search_term': 'Venue %d' % rnd.randint(1, 99)}
+    if name == 'search_artists':
+        return 'POST', '/artists/search', {'search_term': 'Artist %d' % rnd.randint(1, 99)}
+    start_time = '%d-%02d-%02d %02d:00:00' % (rnd.randint(2031, 2035), rnd.randint(1, 12), rnd.randint(1, 28),
+                                             rnd.randint(12, 23))
+    return 'POST', '/shows/create', {'artist_id': rnd.randint(1, artists), 'venue_id': rnd.randint(1, venues),
+                                     'start_time': start_time}
+
+
+def serve(app, db, host, port):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    # Connections inherited from the parent must not be shared.
+    with app.app_context():
+        db.engine.dispose()
+    make_server(host, port, app, threaded=True, request_handler=QuietHandler).serve_forever()
+
+
+def wait_for(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class Client(threading.Thread):
+    """One simulated user, sending requests back to back until `stop`."""
+
+    def __init__(self, number, host, port, mix, venues, artists, samples, stop, think, timeout):
+        super(Client, self).__init__(name='client-%d' % number, daemon=True)
+        self.rnd = random.Random(number)
+        self.host = host
+        self.port = port
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.venues = venues
+        self.artists = artists
+        self.samples = samples
+        self.stop = stop
+        self.think = think
+        self.timeout = timeout
+        self.connection = None
+
+    def send(self, method, path, form):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        body = headers = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        self.connection.request(method, path, body, headers or {})
+        response = self.connection.getresponse()
+        response.read()
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        return response.status
+
+    def run(self):
+        while not self.stop.is_set():
+            name = self.rnd.choices(self.names, self.weights)[0]
+            method, path, form = build_request(name, self.rnd, self.venues, self.artists)
+            started = time.perf_counter()
+            try:
+                outcome = self.send(method, path, form)
+            except (OSError, http.client.HTTPException) as e:
+                outcome = type(e).__name__
+                if self.connection is not None:
+                    self.connection.close()
+                    self.connection = None
+            finished = time.perf_counter()
+            # (finished at, request kind, latency in ms, status or exception name)
+            self.samples.append((finished, name, (finished - started) * 1000, outcome))
+            if self.think:
+                time.sleep(self.rnd.expovariate(1000.0 / self.think))
+
+
+def failed(outcome):
+    return not isinstance(outcome, int) or outcome >= 400
+
+
+def summarize(samples, seconds):
+    latencies = sorted(sample[2] for sample in samples)
+    errors = sum(1 for sample in samples if failed(sample[3]))
+    if not latencies:
+        return {'requests': 0, 'rps': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'errors': 0.0}
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / seconds,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'errors': errors * 100.0 / len(latencies),
+    }
+
+
+ROW = '%-24s %8d %8.1f %9.1f %9.1f %9.1f %7.2f%%'
+HEADER = '%-24s %8s %8s %9s %9s %9s %8s' % ('', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors')
+
+
+def print_row(label, stats):
+    print(ROW % (label, stats['requests'], stats['rps'], stats['p50'], stats['p95'], stats['p99'], stats['errors']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a mix of traffic against a local server.')
+    add_arguments(parser)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already in the database')
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--port', type=int, default=5055, help='port for the server this script starts')
+    parser.add_argument('--concurrency', type=int, default=8, help='simultaneous clients')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run for')
+    parser.add_argument('--interval', type=float, default=5, help='seconds per progress line')
+    parser.add_argument('--think', type=float, default=0,
+                        help='mean pause in ms between one client\'s requests (exponentially distributed)')
+    parser.add_argument('--timeout', type=float, default=30, help='client socket timeout in seconds')
+    parser.add_argument('--mix', type=parse_mix, default=MIX,
+                        help='override request weights, e.g. venues=50,create_show_submission=0')
+    parser.add_argument('--no-caches', action='store_true', help='turn the page and query caches off')
+    parser.add_argument('--output', help='write the windows and summary to this JSON file')
+    args = parser.parse_args()
+
+    app, db = configure(args.database_url)
+    if args.no_caches:
+        app.extensions['page_cache'].enabled = False
+        app.extensions['query_cache'].backend = None
+
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed_from_args(db, args)
+            print('Seeded %d venues, %d artists and %d shows in %.1fs' % (
+                args.venues, args.artists, args.shows, time.perf_counter() - started))
+        from models import Artist, Venue
+        venues = db.session.query(db.func.max(Venue.id)).scalar() or 1
+        artists = db.session.query(db.func.max(Artist.id)).scalar() or 1
+        db.session.remove()
+        db.engine.dispose()
+
+    server = None
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        # Forked, so the server gets its own interpreter and GIL and the
+        # clients' time is not charged to the app.
+        server = multiprocessing.get_context('fork').Process(target=serve, args=(app, db, host, port), daemon=True)
+        server.start()
+    wait_for(host, port)
+
+    samples = []
+    stop = threading.Event()
+    clients = [Client(i, host, port, args.mix, venues, artists, samples, stop, args.think, args.timeout)
+               for i in range(args.concurrency)]
+    print('%d clients for %.0fs against %s:%d' % (args.concurrency, args.duration, host, port))
+    print(HEADER.replace(' ' * 24, '%-24s' % 'elapsed', 1))
+
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+
+    windows = []
+    seen = 0
+    window_started = started
+    while True:
+        now = time.perf_counter()
+        end = min(window_started + args.interval, started + args.duration)
+        time.sleep(max(end - now, 0))
+        # Only this thread reads samples; list.append is atomic, so a slice
+        # up to a length taken first is a consistent snapshot.
+        count = len(samples)
+        window = summarize(samples[seen:count], end - window_started)
+        window['elapsed'] = end - started
+        windows.append(window)
+        print_row('%.0fs' % window['elapsed'], window)
+        seen, window_started = count, end
+        if end >= started + args.duration:
+            break
+
+    stop.set()
+    for client in clients:
+        client.join(args.timeout)
+    elapsed = time.perf_counter() - started
+    samples = [sample for sample in samples if sample[0] <= started + args.duration]
+
+    by_name = defaultdict(list)
+    for sample in samples:
+        by_name[sample[1]].append(sample)
+    summary = {name: summarize(by_name[name], elapsed) for name in args.mix if by_name[name]}
+    summary['total'] = summarize(samples, elapsed)
+
+    print('\n' + HEADER)
+    for name, stats in summary.items():
+        print_row(name, stats)
+
+    failures = Counter(str(sample[3]) for sample in samples if failed(sample[3]))
+    if failures:
+        print('\nErrors: %s' % ', '.join('%s x%d' % item for item in failures.most_common()))
+
+    pool = None
+    try:
+        connection = http.client.HTTPConnection(host, port, timeout=args.timeout)
+        connection.request('GET', '/pool/stats')
+        pool = json.loads(connection.getresponse().read())
+        print('\nServer pool: %d checkouts, %d timeouts, %.1f ms average wait, %.1f ms max wait' % (
+            pool['checkouts'], pool['timeouts'], pool['wait_seconds_avg'] * 1000, pool['wait_seconds_max'] * 1000))
+    except (OSError, http.client.HTTPException, ValueError, KeyError):
+        pass
+
+    if server is not None:
+        server.terminate()
+        server.join()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'mix': args.mix,
+                'windows': windows,
+                'summary': summary,
+                'errors': dict(failures),
+                'pool': pool,
+            }, f, indent=2)
+        print('Wrote %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# ----------------------------------------------------------------------------#
+# Show list rendering benchmark.
+# ----------------------------------------------------------------------------#
+#
+# Renders pages/shows.html for N synthetic shows, once with the old
+# strftime -> dateutil -> babel round trip and once with datetime objects and
+# the cached babel patterns. No database is needed.
+#
+#   $ python -m benchmarks.render_shows --shows 10000
+
+import argparse
+import datetime
+import statistics
+import time
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def make_shows(count):
+    start = datetime.datetime(2020, 6, 28, 20, 0)
+    return [{
+        "venue_id": i % 500 + 1,
+        "venue_name": 'Venue %d' % (i % 500 + 1),
+        "artist_id": i % 900 + 1,
+        "artist_name": 'Artist %d' % (i % 900 + 1),
+        "artist_image_link": 'https://picsum.photos/seed/a%d/300' % (i % 900 + 1),
+        "start_time": start + datetime.timedelta(hours=7 * i),
+    } for i in range(count)]
+
+
+def time_render(app, shows, repeat):
+    timings = []
+    with app.test_request_context('/shows'):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render_template('pages/shows.html', shows=shows)
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time rendering the show list with both datetime filters.')
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from app import create_app, format_datetime
+
+    app = create_app()
+
+    shows = make_shows(args.shows)
+    legacy_shows = [dict(show, start_time=show['start_time'].strftime("%m/%d/%Y, %H:%M")) for show in shows]
+
+    app.jinja_env.filters['datetime'] = legacy_format_datetime
+    legacy = time_render(app, legacy_shows, args.repeat)
+    app.jinja_env.filters['datetime'] = format_datetime
+    current = time_render(app, shows, args.repeat)
+
+    print('%d shows, median of %d renders' % (args.shows, args.repeat))
+    print('%-40s %10.1f ms' % ('strftime -> dateutil -> babel', legacy))
+    print('%-40s %10.1f ms' % ('datetime -> cached babel pattern', current))
+    print('%-40s %10.1fx' % ('speedup', legacy / current))
+
+
+if __name__ == '__main__':
+    main()
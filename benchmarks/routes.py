@@ -0,0 +1,271 @@
+# ----------------------------------------------------------------------------#
+# Route benchmark suite.
+# ----------------------------------------------------------------------------#
+#
+# Seeds a scratch database with benchmarks.seed, then sends every route in the
+# app through the Flask test client, recording latency percentiles and SQL
+# statements per request. Results are written as JSON, and --compare checks a
+# run against a saved one and exits non-zero when a route regressed.
+#
+#   $ python -m benchmarks.routes --database-url postgresql://.../bench --output baseline.json
+#   $ python -m benchmarks.routes --database-url postgresql://.../bench --compare baseline.json
+#
+# Write routes really write, so compare runs made from the same seed.
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+import warnings
+
+from sqlalchemy import event
+
+from benchmarks.seed import add_arguments, configure, seed_from_args
+
+# The forms still subclass flask_wtf.Form, whose rename warning is set to
+# "always" and would otherwise be printed on every form request.
+warnings.filterwarnings('ignore', message='"flask_wtf.Form" has been renamed')
+
+VENUE_FORM = {
+    'name': 'Benchmark Venue', 'city': 'City 1', 'state': 'NY', 'address': '1 Main St',
+    'phone': '212-555-0100', 'image_link': 'https://picsum.photos/seed/bench/300',
+    'facebook_link': 'https://www.facebook.com/benchmark', 'genres': ['Jazz', 'Blues'],
+    'website': 'https://benchmark.example.com', 'seeking_talent': 'y', 'seeking_description': 'Anyone.',
+}
+ARTIST_FORM = dict(VENUE_FORM, name='Benchmark Artist', seeking_venue='y')
+SHOW_FORM = {'artist_id': '1', 'venue_id': '1', 'start_time': '2030-01-01 20:00:00'}
+
+
+class Case(object):
+
+    def __init__(self, endpoint, method, path, data=None, setup=None, name=None):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.data = data
+        # Called before every request, untimed; returns values for `path`.
+        self.setup = setup
+        self.name = name or endpoint
+
+
+def _venue_to_delete(db):
+    from models import Show, Venue
+
+    venue = Venue(**dict(VENUE_FORM, seeking_talent=True))
+    db.session.add(venue)
+    db.session.flush()
+    for day in range(5):
+        db.session.add(Show(venue_id=venue.id, artist_id=1,
+                            start_time=datetime.datetime(2030, 1, 1 + day, 20, 0)))
+    db.session.commit()
+    return {'venue_id': venue.id}
+
+
+def cases():
+    return [
+        Case('index', 'GET', '/'),
+
+        Case('venues', 'GET', '/venues'),
+        Case('venues', 'GET', '/venues?genre=Jazz&genre=Blues&match=any', name='venues by genre'),
+        Case('search_venues', 'POST', '/venues/search', {'search_term': 'Venue 1'}),
+        Case('show_venue', 'GET', '/venues/1'),
+        Case('create_venue_form', 'GET', '/venues/create'),
+        Case('create_venue_submission', 'POST', '/venues/create', VENUE_FORM),
+        Case('edit_venue', 'GET', '/venues/1/edit'),
+        Case('edit_venue_submission', 'POST', '/venues/1/edit', dict(VENUE_FORM, name='Venue 1')),
+        Case('delete_venue', 'DELETE', '/venues/{venue_id}', setup=_venue_to_delete),
+
+        Case('artists', 'GET', '/artists'),
+        Case('artists', 'GET', '/artists?genre=Jazz', name='artists by genre'),
+        Case('search_artists', 'POST', '/artists/search', {'search_term': 'Artist 1'}),
+        Case('show_artist', 'GET', '/artists/1'),
+        Case('create_artist_form', 'GET', '/artists/create'),
+        Case('create_artist_submission', 'POST', '/artists/create', ARTIST_FORM),
+        Case('edit_artist', 'GET', '/artists/1/edit'),
+        Case('edit_artist_submission', 'POST', '/artists/1/edit', dict(ARTIST_FORM, name='Artist 1')),
+
+        Case('shows', 'GET', '/shows'),
+        Case('create_shows', 'GET', '/shows/create'),
+        Case('create_show_submission', 'POST', '/shows/create', SHOW_FORM),
+
+        Case('export', 'GET', '/shows/export.csv?venue_id=1', name='export shows.csv'),
+        Case('export', 'GET', '/venues/export.ndjson', name='export venues.ndjson'),
+
+        Case('api.list_resources', 'GET', '/api/v1/shows?per_page=30', name='api shows page'),
+        Case('api.list_resources', 'GET', '/api/v1/venues?cursor=&fields=id,name', name='api venues cursor'),
+        Case('api.get_resource', 'GET', '/api/v1/venues/1?fields=id,name,upcoming_shows'),
+        Case('api.batch_resources', 'GET', '/api/v1/artists/batch?ids=' + ','.join(map(str, range(1, 51)))),
+
+        Case('cache_stats', 'GET', '/cache/stats'),
+        Case('connection_pool_stats', 'GET', '/pool/stats'),
+        Case('prometheus_metrics', 'GET', '/metrics'),
+    ]
+
+
+def uncovered(app, suite):
+    covered = {(case.endpoint, case.method) for case in suite}
+    routes = set()
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint in ('static', 'assets'):
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            routes.add((rule.endpoint, method))
+    return sorted(routes - covered)
+
+
+def percentile(timings, fraction):
+    # Nearest rank on sorted timings.
+    return timings[min(len(timings) - 1, max(0, int(round(fraction * len(timings))) - 1))]
+
+
+def run_case(app, db, case, repeat, warmup, statements):
+    client = app.test_client(use_cookies=False)
+    timings = []
+    statuses = set()
+    queries = []
+
+    for i in range(warmup + repeat):
+        with app.app_context():
+            values = case.setup(db) if case.setup else {}
+        path = case.path.format(**values)
+
+        statements[0] = 0
+        started = time.perf_counter()
+        response = client.open(path, method=case.method, data=case.data)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+            statuses.add(response.status_code)
+            queries.append(statements[0])
+
+    timings.sort()
+    return {
+        'endpoint': case.endpoint,
+        'method': case.method,
+        'path': case.path,
+        'status': sorted(statuses),
+        'queries': max(queries),
+        'latency_ms': {
+            'min': timings[0],
+            'p50': percentile(timings, 0.50),
+            'p90': percentile(timings, 0.90),
+            'p99': percentile(timings, 0.99),
+            'max': timings[-1],
+            'mean': sum(timings) / len(timings),
+        },
+    }
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Print current against baseline; return the names of regressed routes."""
+    regressed = []
+    print('\n%-28s %10s %10s %8s %6s %6s' % ('route', 'base p50', 'p50', 'change', 'base q', 'q'))
+    for name, result in results['routes'].items():
+        base = baseline['routes'].get(name)
+        if base is None:
+            print('%-28s %10s %10.2f %8s %6s %6d  new' % (name, '-', result['latency_ms']['p50'], '-', '-',
+                                                         result['queries']))
+            continue
+
+        before, after = base['latency_ms']['p50'], result['latency_ms']['p50']
+        slower = after > before * (1 + threshold) and after - before > min_delta
+        more_queries = result['queries'] > base['queries']
+        flags = ' '.join(flag for flag, hit in (('SLOWER', slower), ('MORE QUERIES', more_queries)) if hit)
+        if flags:
+            regressed.append(name)
+        print('%-28s %10.2f %10.2f %+7.0f%% %6d %6d  %s' % (name, before, after, (after / before - 1) * 100,
+                                                          base['queries'], result['queries'], flags))
+
+    for name in baseline['routes']:
+        if name not in results['routes']:
+            print('%-28s missing from this run' % name)
+    return regressed
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL) \
+            .decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route through the Flask test client.')
+    add_arguments(parser)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already in the database')
+    parser.add_argument('--repeat', type=int, default=30, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route first')
+    parser.add_argument('--caches', action='store_true',
+                        help='keep the page and query caches on (off by default, so each request does its work)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare with a saved JSON run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='p50 slowdown, as a fraction, that counts as a regression')
+    parser.add_argument('--min-delta', type=float, default=1.0,
+                        help='ignore p50 slowdowns smaller than this many milliseconds')
+    args = parser.parse_args()
+
+    app, db = configure(args.database_url)
+    if not args.caches:
+        app.extensions['page_cache'].enabled = False
+        app.extensions['query_cache'].backend = None
+
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed_from_args(db, args)
+            print('Seeded %d venues, %d artists and %d shows in %.1fs' % (
+                args.venues, args.artists, args.shows, time.perf_counter() - started))
+
+        statements = [0]
+        event.listen(db.engine, 'after_cursor_execute', lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+    suite = cases()
+    missing = uncovered(app, suite)
+    if missing:
+        print('Routes without a benchmark case: %s' % ', '.join('%s %s' % route for route in missing))
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'repeat': args.repeat,
+            'caches': args.caches,
+            'seed': {key: getattr(args, key) for key in ('venues', 'artists', 'shows', 'cities', 'genres', 'seed')},
+        },
+        'routes': {},
+    }
+
+    print('%-28s %6s %9s %9s %9s %9s %5s' % ('route', 'status', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'sql'))
+    for case in suite:
+        result = run_case(app, db, case, args.repeat, args.warmup, statements)
+        results['routes'][case.name] = result
+        latency = result['latency_ms']
+        print('%-28s %6s %9.2f %9.2f %9.2f %9.2f %5d' % (
+            case.name, ','.join(map(str, result['status'])), latency['p50'], latency['p90'], latency['p99'],
+            latency['max'], result['queries']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('\nWrote %s' % args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressed = compare(results, baseline, args.threshold, args.min_delta)
+        if regressed:
+            print('\n%d route(s) regressed: %s' % (len(regressed), ', '.join(regressed)))
+            sys.exit(1)
+        print('\nNo regressions.')
+
+
+if __name__ == '__main__':
+    main()
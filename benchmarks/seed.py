@@ -0,0 +1,134 @@
+# ----------------------------------------------------------------------------#
+# Deterministic data generator for benchmarks.
+# ----------------------------------------------------------------------------#
+#
+# Fills an empty (migrated) database with venues, artists and shows drawn from
+# a seeded random generator, so two runs with the same arguments produce the
+# same rows. Rows are streamed in with COPY in fixed-size chunks.
+
+import argparse
+import datetime
+import io
+import random
+
+from extensions import db, query_cache
+from forms import Genre
+from models import ShowRollover, reconcile_show_counts
+
+STATES = ['CA', 'NY', 'TX', 'IL', 'WA', 'LA', 'MA', 'CO', 'GA', 'OR']
+CHUNK_SIZE = 100000
+
+
+def add_arguments(parser):
+    parser.add_argument('--database-url', required=True,
+                        help='scratch database to seed; it is truncated first')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--cities', type=int, default=50)
+    parser.add_argument('--genres', type=int, default=len(Genre),
+                        help='number of distinct genres to draw from (max %d)' % len(Genre))
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def _copy(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    count = 0
+    statement = 'COPY "%s" (%s) FROM STDIN WITH CSV' % (table, ', '.join(columns))
+
+    for row in rows:
+        buffer.write(','.join(row))
+        buffer.write('\n')
+        count += 1
+        if count % CHUNK_SIZE == 0:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer = io.StringIO()
+
+    if buffer.tell():
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+
+
+def _genres(rnd, genres):
+    return '"{%s}"' % ','.join(rnd.sample(genres, rnd.randint(1, min(3, len(genres)))))
+
+
+def _phone(rnd):
+    return '%03d-%03d-%04d' % (rnd.randint(200, 999), rnd.randint(200, 999), rnd.randint(0, 9999))
+
+
+def seed(db, venues=1000, artists=2000, shows=100000, cities=50, genres=len(Genre), seed=1, now=None):
+    """Truncate Venue, Artist and Show and fill them with generated rows.
+
+    Show start times are spread over two years either side of `now`, and the
+    show counters are reconciled against `now` once everything is loaded.
+    """
+    rnd = random.Random(seed)
+    now = now or datetime.datetime.now().replace(microsecond=0)
+    areas = [('City %d' % i, STATES[i % len(STATES)]) for i in range(cities)]
+    genre_names = list(Genre.__members__)[:genres]
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('TRUNCATE "Show", "Venue", "Artist" RESTART IDENTITY CASCADE')
+
+        _copy(cursor, 'Venue', ['name', 'city', 'state', 'address', 'phone', 'genres', 'image_link',
+                                'facebook_link', 'website', 'seeking_talent'], (
+            ['Venue %d' % i, city, state, '%d Main St' % rnd.randint(1, 9999), _phone(rnd),
+             _genres(rnd, genre_names), 'https://picsum.photos/seed/v%d/300' % i,
+             'https://www.facebook.com/venue%d' % i, 'https://venue%d.example.com' % i,
+             str(rnd.random() < 0.5).lower()]
+            for i, (city, state) in ((i, rnd.choice(areas)) for i in range(1, venues + 1))
+        ))
+        _copy(cursor, 'Artist', ['name', 'city', 'state', 'phone', 'genres', 'image_link',
+                                 'facebook_link', 'website', 'seeking_venue'], (
+            ['Artist %d' % i, city, state, _phone(rnd), _genres(rnd, genre_names),
+             'https://picsum.photos/seed/a%d/300' % i, 'https://www.facebook.com/artist%d' % i,
+             'https://artist%d.example.com' % i, str(rnd.random() < 0.5).lower()]
+            for i, (city, state) in ((i, rnd.choice(areas)) for i in range(1, artists + 1))
+        ))
+
+        span = int(datetime.timedelta(days=730).total_seconds())
+        _copy(cursor, 'Show', ['venue_id', 'artist_id', 'start_time'], (
+            [str(rnd.randint(1, venues)), str(rnd.randint(1, artists)),
+             (now + datetime.timedelta(seconds=rnd.randint(-span, span))).isoformat(' ')]
+            for _ in range(shows)
+        ))
+        connection.commit()
+    finally:
+        connection.close()
+
+    if ShowRollover.query.first() is None:
+        db.session.add(ShowRollover(rolled_over_at=now))
+        db.session.commit()
+    reconcile_show_counts(now)
+
+    db.session.execute('ANALYZE "Venue"; ANALYZE "Artist"; ANALYZE "Show"')
+    db.session.commit()
+    # COPY bypasses the session, so tell the query cache by hand.
+    query_cache.bump('Venue', 'Artist', 'Show')
+
+
+def seed_from_args(db, args):
+    seed(db, venues=args.venues, artists=args.artists, shows=args.shows,
+         cities=args.cities, genres=args.genres, seed=args.seed)
+
+
+def configure(database_url):
+    # Build an app on the benchmark database and return it with the db handle.
+    from app import create_app
+
+    return create_app({'SQLALCHEMY_DATABASE_URI': database_url}), db
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed a scratch database with generated Fyyur data.')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    app, db = configure(args.database_url)
+    with app.app_context():
+        seed_from_args(db, args)
+        print('Seeded %d venues, %d artists and %d shows.' % (args.venues, args.artists, args.shows))
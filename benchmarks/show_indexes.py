@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------#
+# Show index benchmark.
+# ----------------------------------------------------------------------------#
+#
+# Seeds a scratch database, then runs EXPLAIN ANALYZE on the hot Show access
+# paths without and with the (venue_id, start_time), (artist_id, start_time)
+# and (start_time) indexes, printing each plan and a timing comparison.
+#
+#   $ python -m benchmarks.show_indexes --database-url postgresql://.../bench --shows 1000000
+
+import argparse
+import datetime
+import statistics
+import time
+
+from benchmarks.seed import add_arguments, configure, seed_from_args
+
+INDEXES = [
+    ('ix_Show_venue_id_start_time', '"Show" (venue_id, start_time)'),
+    ('ix_Show_artist_id_start_time', '"Show" (artist_id, start_time)'),
+    ('ix_Show_start_time', '"Show" (start_time)'),
+]
+
+
+def hot_queries(db, now):
+    from models import Artist, Show, Venue
+
+    venue_id = artist_id = 42
+    return [
+        ('show_venue upcoming shows', db.session.query(Show, Artist)
+            .filter(Show.venue_id == venue_id)
+            .filter(Show.start_time > now)
+            .filter(Artist.id == Show.artist_id)),
+        ('show_venue past shows', db.session.query(Show, Artist)
+            .filter(Show.venue_id == venue_id)
+            .filter(Show.start_time < now)
+            .filter(Artist.id == Show.artist_id)),
+        ('show_artist upcoming shows', db.session.query(Show, Venue)
+            .filter(Show.artist_id == artist_id)
+            .filter(Show.start_time > now)
+            .filter(Venue.id == Show.venue_id)),
+        ('venue upcoming count', db.session.query(db.func.count(Show.id))
+            .filter(Show.venue_id == venue_id)
+            .filter(Show.start_time > now)),
+        ('shows newest first', db.session.query(Show, Venue, Artist)
+            .filter(Show.venue_id == Venue.id)
+            .filter(Show.artist_id == Artist.id)
+            .order_by(Show.start_time.desc())
+            .limit(50)),
+        ('rollover window', db.session.query(Show.venue_id, db.func.count(Show.id))
+            .filter(Show.start_time > now - datetime.timedelta(minutes=15))
+            .filter(Show.start_time <= now)
+            .group_by(Show.venue_id)),
+    ]
+
+
+def explain(db, query, repeat):
+    statement = query.statement.compile(dialect=db.engine.dialect)
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + str(statement), statement.params)
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.execute(str(statement), statement.params)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        connection.rollback()
+    finally:
+        connection.close()
+    return plan, statistics.median(timings)
+
+
+def set_indexes(db, enabled):
+    for name, target in INDEXES:
+        if enabled:
+            db.session.execute('CREATE INDEX IF NOT EXISTS "%s" ON %s' % (name, target))
+        else:
+            db.session.execute('DROP INDEX IF EXISTS "%s"' % name)
+    db.session.execute('ANALYZE "Show"')
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN ANALYZE the Show access paths with and without indexes.')
+    add_arguments(parser)
+    parser.set_defaults(shows=1000000)
+    parser.add_argument('--repeat', type=int, default=5, help='timed executions per query')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already in the database')
+    args = parser.parse_args()
+
+    app, db = configure(args.database_url)
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed_from_args(db, args)
+            print('Seeded %d shows in %.1fs' % (args.shows, time.perf_counter() - started))
+
+        now = datetime.datetime.now()
+        results = {}
+        for label, enabled in (('before', False), ('after', True)):
+            set_indexes(db, enabled)
+            for name, query in hot_queries(db, now):
+                plan, median = explain(db, query, args.repeat)
+                results.setdefault(name, {})[label] = median
+                print('\n== %s (%s indexes) ==\n%s' % (name, label, plan))
+
+        print('\n%-30s %12s %12s %9s' % ('query', 'before (ms)', 'after (ms)', 'speedup'))
+        for name, timing in results.items():
+            print('%-30s %12.2f %12.2f %8.1fx' % (name, timing['before'], timing['after'],
+                                                  timing['before'] / max(timing['after'], 0.001)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# ----------------------------------------------------------------------------#
+# Startup time benchmark.
+# ----------------------------------------------------------------------------#
+#
+# Starts fresh interpreters and times each step of bringing the app up:
+# importing app.py, create_app(), and the first request to / (template
+# compilation) and to /venues (first database connection). The process total
+# includes the interpreter's own start. A worker forked from a preloaded app
+# only pays for the first requests; one that is not preloaded pays for all of it.
+#
+#   $ python -m benchmarks.startup --database-url postgresql://.../bench --runs 10
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+app = module.create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]} if sys.argv[1] else None)
+created = time.perf_counter()
+client = app.test_client()
+client.get('/')
+index = time.perf_counter()
+if sys.argv[1]:
+    client.get('/venues')
+venues = time.perf_counter()
+print(json.dumps({
+    'import app': imported - started,
+    'create_app()': created - imported,
+    'first GET /': index - created,
+    'first GET /venues': venues - index if sys.argv[1] else None,
+    'modules': len(sys.modules),
+}))
+'''
+
+STEPS = ['import app', 'create_app()', 'first GET /', 'first GET /venues', 'process total']
+
+
+def run_once(database_url):
+    started = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', CHILD, database_url or ''])
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result['process total'] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time a cold start of the app, step by step.')
+    parser.add_argument('--database-url', help='also time the first database request against this database')
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes to start')
+    args = parser.parse_args()
+
+    runs = [run_once(args.database_url) for _ in range(args.runs)]
+
+    print('%d cold starts, %d modules loaded' % (args.runs, runs[0]['modules']))
+    print('%-20s %10s %10s %10s' % ('step', 'median ms', 'min ms', 'max ms'))
+    for step in STEPS:
+        timings = [run[step] * 1000 for run in runs if run[step] is not None]
+        if timings:
+            print('%-20s %10.1f %10.1f %10.1f' % (step, statistics.median(timings), min(timings), max(timings)))
+
+
+if __name__ == '__main__':
+    main()
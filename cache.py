@@ -0,0 +1,527 @@
+# ----------------------------------------------------------------------------#
+# Page cache.
+# ----------------------------------------------------------------------------#
+
+import datetime
+import hashlib
+import itertools
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, make_response, request, session
+from jinja2 import Undefined, nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+
+
+class PageCache(object):
+    """In-process cache of rendered GET pages with TTL and LRU eviction.
+
+    Entries are keyed by path and query string and carry a set of tags such
+    as ``'venues'`` or ``'venue:3'`` naming the data they display. Write
+    handlers call :meth:`invalidate` with the tags they touched, which drops
+    exactly the pages that showed that data.
+    """
+
+    def __init__(self, app=None):
+        self.max_entries = 1000
+        self.ttl = 60
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a page rendered before a write
+        # committed is not stored after that write invalidated its tags.
+        self._generation = 0
+        self._invalidated_at = {}
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('PAGE_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('PAGE_CACHE_TTL', self.ttl)
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', self.enabled)
+        app.extensions['page_cache'] = self
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, body, mimetype, tags = entry
+            if expires < time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body, mimetype
+
+    def set(self, key, body, mimetype, tags, generation=None):
+        with self._lock:
+            if generation is not None and any(self._invalidated_at.get(tag, -1) > generation for tag in tags):
+                return
+
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, body, mimetype, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                tag = str(tag)
+                self._invalidated_at[tag] = self._generation
+                for key in list(self._tags.get(tag, ())):
+                    self._discard(key)
+                    self.invalidations += 1
+
+            # Only renders still in flight care about old invalidations.
+            if len(self._invalidated_at) > 10000:
+                horizon = self._generation - 1000
+                self._invalidated_at = {tag: generation for tag, generation in self._invalidated_at.items()
+                                        if generation > horizon}
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+            self._invalidated_at.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[3]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    @staticmethod
+    def tag(*tags):
+        """Add tags to the page being rendered by the current request."""
+        if 'page_cache_tags' in g:
+            g.page_cache_tags.update(str(tag) for tag in tags)
+
+    def cached(self, *tags):
+        """Cache a GET view's page under its path and query string.
+
+        ``tags`` may reference the view's arguments, e.g. ``'venue:{venue_id}'``;
+        the view can add more while rendering with :meth:`tag`.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pending flash messages are rendered into the page, so such
+                # requests neither read nor fill the cache.
+                if not self.enabled or request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                # Under conditional() the validator's ETag is part of the key, so
+                # a page is re-rendered as soon as the data it shows changes.
+                key = (request.full_path, g.get('etag'))
+                entry = self.get(key)
+                if entry is not None:
+                    body, mimetype = entry
+                    return Response(body, mimetype=mimetype)
+
+                with self._lock:
+                    generation = self._generation
+                g.page_cache_tags = {tag.format(**kwargs) for tag in tags}
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    self.set(key, response.get_data(), response.mimetype, frozenset(g.page_cache_tags), generation)
+                return response
+
+            return wrapper
+
+        return decorator
+
+
+# ----------------------------------------------------------------------------#
+# Conditional requests.
+# ----------------------------------------------------------------------------#
+
+def conditional(validator):
+    """Answer If-None-Match and If-Modified-Since before the view runs.
+
+    ``validator`` is called with the view's arguments and returns
+    ``(last_modified, token)`` describing the data the page shows, or None
+    to let the view handle the request. The page's weak ETag is a hash of
+    the token, so a matching request gets a 304 without running any of the
+    view's queries or its template.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            state = validator(**kwargs)
+            if state is None:
+                return view(*args, **kwargs)
+
+            last_modified, token = state
+            etag = hashlib.sha1(repr(token).encode('utf-8')).hexdigest()
+            if last_modified is not None:
+                # The columns hold local time; HTTP dates are whole UTC seconds.
+                last_modified = last_modified.astimezone(datetime.timezone.utc) \
+                    .replace(tzinfo=None, microsecond=0)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = last_modified is not None and request.if_modified_since is not None \
+                    and last_modified <= request.if_modified_since
+
+            if not_modified:
+                response = Response(status=304)
+            else:
+                g.etag = etag
+                response = make_response(view(*args, **kwargs))
+
+            if response.status_code in (200, 304):
+                response.set_etag(etag, weak=True)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+                response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+# ----------------------------------------------------------------------------#
+# Query-result cache.
+# ----------------------------------------------------------------------------#
+
+class MemoryBackend(object):
+    """Process-local backend, for development and single-worker deployments."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._values.get(key)
+                if entry is not None and (entry[0] is None or entry[0] > now):
+                    self._values.move_to_end(key)
+                    values.append(entry[1])
+                else:
+                    values.append(None)
+        return values
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = (time.monotonic() + ttl if ttl else None, value)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+    def incr_many(self, keys):
+        with self._lock:
+            for key in keys:
+                entry = self._values.pop(key, None)
+                self._values[key] = (None, (entry[1] if entry else 0) + 1)
+
+
+class RedisBackend(object):
+    """Backend for anything speaking the Redis protocol, shared by every worker.
+
+    Connection errors are logged and treated as cache misses, so an outage
+    only costs the cache, never a request.
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        self._errors = (redis.RedisError, OSError)
+
+    def get_many(self, keys):
+        try:
+            return self._client.mget(keys)
+        except self._errors:
+            logging.getLogger(__name__).warning('query cache read failed', exc_info=True)
+            return [None] * len(keys)
+
+    def set(self, key, value, ttl=None):
+        try:
+            self._client.set(key, value, ex=ttl or None)
+        except self._errors:
+            logging.getLogger(__name__).warning('query cache write failed', exc_info=True)
+
+    def incr_many(self, keys):
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            for key in keys:
+                pipeline.incr(key)
+            pipeline.execute()
+        except self._errors:
+            logging.getLogger(__name__).warning('query cache invalidation failed', exc_info=True)
+
+
+def backend_from_url(url, max_entries=10000):
+    if url.startswith('memory://'):
+        return MemoryBackend(max_entries)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError('Unsupported QUERY_CACHE_URL: %r' % url)
+
+
+class QueryCache(object):
+    """Caches read-helper results behind a pluggable backend.
+
+    Every table has a version counter in the backend, and each cache key
+    embeds the versions of the tables its helper reads. Committing a write
+    bumps the versions of the tables it touched, so every worker's dependent
+    entries stop matching at once; they simply age out of the backend.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.backend = None
+        self.ttl = 60
+        self.prefix = 'fyyur:'
+        self.hits = self.misses = 0
+
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db=None):
+        url = app.config.get('QUERY_CACHE_URL')
+        self.ttl = app.config.get('QUERY_CACHE_TTL', self.ttl)
+        self.prefix = app.config.get('QUERY_CACHE_PREFIX', self.prefix)
+        self.backend = backend_from_url(url, app.config.get('QUERY_CACHE_SIZE', 10000)) if url else None
+        app.extensions['query_cache'] = self
+
+        if db is not None:
+            self.track_writes(db.session)
+
+    def _version_keys(self, tables):
+        return [self.prefix + 'version:' + table for table in tables]
+
+    def bump(self, *tables):
+        if self.backend is not None and tables:
+            self.backend.incr_many(self._version_keys(sorted(set(tables))))
+
+    def cached(self, *tables):
+        """Cache a read helper's result until one of ``tables`` is written."""
+
+        def decorator(func):
+            name = func.__module__ + '.' + func.__qualname__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return func(*args, **kwargs)
+
+                versions = self.backend.get_many(self._version_keys(tables))
+                arguments = repr(([_key_part(arg) for arg in args], sorted(kwargs.items())))
+                key = '%squery:%s:%s:%s' % (self.prefix, name,
+                                            hashlib.sha1(arguments.encode('utf-8')).hexdigest(),
+                                            '.'.join(_version(version) for version in versions))
+
+                cached = self.backend.get_many([key])[0]
+                if cached is not None:
+                    self.hits += 1
+                    return pickle.loads(cached)
+
+                self.misses += 1
+                result = func(*args, **kwargs)
+                self.backend.set(key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL), self.ttl)
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def track_writes(self, session):
+        # Remember which tables each transaction wrote and bump them once it
+        # commits; a rollback forgets them.
+        def written(session):
+            return session.info.setdefault('query_cache_tables', set())
+
+        def after_flush(session, flush_context):
+            for instance in itertools.chain(session.new, session.dirty, session.deleted):
+                table = getattr(instance, '__table__', None)
+                if table is not None:
+                    written(session).add(table.name)
+
+        def after_bulk(context):
+            entity = context.query.column_descriptions[0]['entity']
+            written(context.session).add(entity.__table__.name)
+
+        def after_commit(session):
+            self.bump(*session.info.pop('query_cache_tables', ()))
+
+        def after_rollback(session):
+            session.info.pop('query_cache_tables', None)
+
+        event.listen(session, 'after_flush', after_flush)
+        event.listen(session, 'after_bulk_update', after_bulk)
+        event.listen(session, 'after_bulk_delete', after_bulk)
+        event.listen(session, 'after_commit', after_commit)
+        event.listen(session, 'after_soft_rollback', lambda session, previous: after_rollback(session))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__ if self.backend is not None else None,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _version(value):
+    if value is None:
+        return '0'
+    return value.decode('ascii') if isinstance(value, bytes) else str(value)
+
+
+def _key_part(value):
+    # Model instances are identified by class and primary key, classes by name.
+    if isinstance(value, type):
+        return value.__name__
+    table = getattr(value, '__table__', None)
+    if table is not None:
+        return type(value).__name__, getattr(value, 'id', None)
+    return value
+
+
+# ----------------------------------------------------------------------------#
+# Fragment cache.
+# ----------------------------------------------------------------------------#
+
+class FragmentCache(object):
+    """In-process LRU cache of rendered template fragments.
+
+    Templates wrap a tile in ``{% cache show.id, show.updated_at %}`` ...
+    ``{% endcache %}``. The values name the entities the tile shows and
+    their versions, so editing any of them changes the key and only that
+    tile renders again. Stale entries are never looked up again and fall
+    off the end of the LRU.
+    """
+
+    def __init__(self, app=None):
+        self.max_entries = 20000
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('FRAGMENT_CACHE_SIZE', self.max_entries)
+        self.enabled = app.config.get('FRAGMENT_CACHE_ENABLED', self.enabled)
+        app.extensions['fragment_cache'] = self
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def set(self, key, fragment):
+        with self._lock:
+            self._entries[key] = fragment
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class FragmentCacheExtension(Extension):
+    """The ``{% cache key, ... %}`` tag; see :class:`FragmentCache`."""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # The tag's own position is part of the key, so the same entity can
+        # be cached as different tiles in different places.
+        key = [nodes.Const('%s:%d' % (parser.name, lineno)), parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.Tuple(key, 'load')]), [], [], body) \
+            .set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        # An undefined part, a misspelt attribute say, would give every tile
+        # the same key.
+        if cache is None or not cache.enabled or any(isinstance(part, Undefined) for part in key):
+            return caller()
+
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            cache.set(key, fragment)
+        return fragment
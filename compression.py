@@ -0,0 +1,120 @@
+# ----------------------------------------------------------------------------#
+# Response compression.
+# ----------------------------------------------------------------------------#
+#
+# Compresses HTML, JSON and the exports with brotli, when the brotli package
+# is installed and the client accepts it, or gzip. Responses under
+# COMPRESS_MIN_SIZE are sent as they are: a few hundred bytes gain little and
+# still cost a compressor. Streamed responses are compressed chunk by chunk
+# as they are sent. Files sent by the static and asset routes are left alone.
+
+import zlib
+
+from flask import request
+
+MIMETYPES = [
+    'text/html',
+    'application/json',
+    'text/csv',
+    'application/x-ndjson',
+    'text/css',
+    'application/javascript',
+]
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class Compression(object):
+    """after_request handler that compresses responses per Accept-Encoding."""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.mimetypes = set(MIMETYPES)
+        self.min_size = 500
+        self.level = 6
+        self.brotli_quality = 4
+        self.brotli = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESS_ENABLED', self.enabled)
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', self.mimetypes))
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', self.brotli_quality)
+        self.brotli = _brotli()
+        app.extensions['compression'] = self
+        app.after_request(self.compress)
+
+    def encoding(self):
+        """The encoding to use for this request, or None."""
+        accepted = request.accept_encodings
+        if self.brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def compressor(self, encoding):
+        """Return (compress, flush) functions for a new stream."""
+        if encoding == 'br':
+            compressor = self.brotli.Compressor(quality=self.brotli_quality)
+            return compressor.process, compressor.finish
+        # wbits 31 writes a gzip header and trailer.
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+
+    def compress(self, response):
+        # direct_passthrough is set on files from send_file.
+        if not self.enabled or response.mimetype not in self.mimetypes or response.direct_passthrough:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if response.status_code < 200 or response.status_code in (204, 206, 304) \
+                or 'Content-Encoding' in response.headers \
+                or 'no-transform' in response.headers.get('Cache-Control', ''):
+            return response
+
+        if not response.is_streamed and response.calculate_content_length() < self.min_size:
+            return response
+
+        encoding = self.encoding()
+        if encoding is None:
+            return response
+
+        compress, flush = self.compressor(encoding)
+        if response.is_streamed:
+            response.response = self._stream(response.response, compress, flush)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compress(response.get_data()) + flush())
+        response.headers['Content-Encoding'] = encoding
+
+        # A strong ETag names exact bytes; the compressed body is different.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    @staticmethod
+    def _stream(chunks, compress, flush):
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = compress(chunk)
+                if data:
+                    yield data
+            yield flush()
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
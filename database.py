@@ -0,0 +1,108 @@
+# ----------------------------------------------------------------------------#
+# Engine and connection pool.
+# ----------------------------------------------------------------------------#
+
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class PoolStats(object):
+    """Checkout wait and usage counters for the connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            stats = {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_total,
+                'wait_seconds_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_seconds_max': self.wait_max,
+            }
+
+        if isinstance(pool, QueuePool):
+            stats.update({
+                'pool': 'QueuePool',
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+            })
+        elif pool is not None:
+            stats['pool'] = type(pool).__name__
+        return stats
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection.
+
+    ``_do_get`` is where QueuePool blocks when every connection is in use, so
+    timing it captures exactly the checkout wait, including timeouts.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super(TimedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - started)
+        return connection
+
+
+def engine_options(config):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings."""
+    if config.get('DB_PGBOUNCER'):
+        # PgBouncer multiplexes server connections per transaction, so keep
+        # no idle connections here and never send session-level settings
+        # (startup options included); see apply_statement_timeout().
+        return {'poolclass': NullPool}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', -1),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', False),
+    }
+    if config.get('DB_STATEMENT_TIMEOUT'):
+        options['connect_args'] = {'options': '-c statement_timeout=%d' % config['DB_STATEMENT_TIMEOUT']}
+    return options
+
+
+def apply_statement_timeout(engine, timeout):
+    # Transaction-scoped equivalent of the statement_timeout startup option,
+    # which is the only form PgBouncer's transaction mode can honour.
+    @event.listens_for(engine, 'begin')
+    def set_local_statement_timeout(connection):
+        connection.execute('SET LOCAL statement_timeout = %d' % timeout)
+
+
+def init_engine(app, db):
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).update(engine_options(app.config))
+
+    if app.config.get('DB_PGBOUNCER') and app.config.get('DB_STATEMENT_TIMEOUT'):
+        with app.app_context():
+            apply_statement_timeout(db.engine, app.config['DB_STATEMENT_TIMEOUT'])
@@ -0,0 +1,101 @@
+# ----------------------------------------------------------------------------#
+# Export.
+# ----------------------------------------------------------------------------#
+#
+# Streams venues, artists or shows out as CSV or NDJSON. Rows come from a
+# server-side cursor (Query.yield_per) and are encoded a chunk at a time, so
+# memory stays flat however many rows match. The columns are the importer's,
+# plus ids and display names, so an export can be fed back to `flask import`.
+
+import csv
+import io
+import itertools
+import json
+
+from importer import SPECS
+from models import Artist, Show, Venue
+
+EXPORT_COLUMNS = {
+    'venues': ['id'] + SPECS['venues'].columns,
+    'artists': ['id'] + SPECS['artists'].columns,
+    'shows': ['id', 'artist_id', 'artist_name', 'venue_id', 'venue_name', 'start_time'],
+}
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_query(db, kind, start=None, end=None, venue_id=None, artist_id=None):
+    """Build the query for an export.
+
+    The filters apply to shows. Venue and artist exports keep the rows that
+    have at least one show matching them.
+    """
+    show_filters = []
+    if start is not None:
+        show_filters.append(Show.start_time >= start)
+    if end is not None:
+        show_filters.append(Show.start_time < end)
+    if venue_id is not None:
+        show_filters.append(Show.venue_id == venue_id)
+    if artist_id is not None:
+        show_filters.append(Show.artist_id == artist_id)
+
+    if kind == 'shows':
+        return db.session.query(Show.id, Show.artist_id, Artist.name, Show.venue_id, Venue.name, Show.start_time) \
+            .join(Artist, Artist.id == Show.artist_id) \
+            .join(Venue, Venue.id == Show.venue_id) \
+            .filter(*show_filters) \
+            .order_by(Show.start_time, Show.id)
+
+    model = Venue if kind == 'venues' else Artist
+    query = db.session.query(*[getattr(model, column) for column in EXPORT_COLUMNS[kind]])
+    if show_filters:
+        owner = Show.venue_id if kind == 'venues' else Show.artist_id
+        query = query.filter(model.id.in_(db.session.query(owner).filter(*show_filters)))
+    return query.order_by(model.id)
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    return value
+
+
+def encode_rows(rows, columns, file_format, chunk_size=1000):
+    """Yield the encoded export a chunk of ``chunk_size`` rows at a time."""
+    buffer = io.StringIO()
+    lists = [index for index, column in enumerate(columns) if column == 'genres']
+
+    if file_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        if file_format == 'csv':
+            if lists:
+                chunk = [[_csv_value(value) for value in row] for row in chunk]
+            writer.writerows(chunk)
+        else:
+            for row in chunk:
+                buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+                buffer.write('\n')
+
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_rows(db, kind, file_format, chunk_size=1000, **filters):
+    query = export_query(db, kind, **filters).yield_per(chunk_size)
+    return encode_rows(query, EXPORT_COLUMNS[kind], file_format, chunk_size)
@@ -0,0 +1,28 @@
+# ----------------------------------------------------------------------------#
+# Extensions.
+# ----------------------------------------------------------------------------#
+#
+# Created unbound and initialised by create_app(), so models, views and
+# scripts can import them without importing, or creating, the app.
+
+from flask_moment import Moment
+from flask_sqlalchemy import SQLAlchemy
+
+from assets import Assets
+from cache import FragmentCache, PageCache, QueryCache
+from compression import Compression
+from database import pool_stats
+from instrumentation import QueryInstrumentation, SlowQueryLog
+from metrics import Metrics
+
+db = SQLAlchemy()
+assets = Assets()
+moment = Moment()
+query_instrumentation = QueryInstrumentation()
+slow_query_log = SlowQueryLog()
+page_cache = PageCache()
+query_cache = QueryCache()
+fragment_cache = FragmentCache()
+metrics = Metrics(db=db, page_cache=page_cache, query_cache=query_cache, fragment_cache=fragment_cache,
+                  pool_stats=pool_stats)
+compression = Compression()
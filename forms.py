@@ -48,7 +48,8 @@ def validate_phone(form, field):
 
 def validate_facebook_link(form, field):
     allowed = ["facebook.com", "www.facebook.com"]
-    host = field.data.split('/')[2].lower()
+    parts = (field.data or '').split('/')
+    host = parts[2].lower() if len(parts) > 2 else ''
 
     if host not in allowed:
         raise ValidationError("Invalid Fabebook link.")
@@ -0,0 +1,210 @@
+# ----------------------------------------------------------------------------#
+# Bulk import.
+# ----------------------------------------------------------------------------#
+#
+# Streams venues, artists or shows from CSV or NDJSON, validates every row
+# with the same WTForms the create pages use, and loads the valid rows in
+# batches with a single multi-row INSERT (or COPY) per batch. Rejected rows
+# are written to a report as they are found, so memory stays bounded by the
+# batch size however large the input is.
+
+import csv
+import io
+import json
+import warnings
+
+from psycopg2.extras import execute_values
+from werkzeug.datastructures import MultiDict
+
+from extensions import query_cache
+from forms import ArtistForm, ShowForm, VenueForm
+from models import Artist, Venue, reconcile_show_counts
+
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y', 'on')
+
+# The forms still subclass flask_wtf.Form, whose rename warning is set to
+# "always" and would otherwise be printed once per imported row.
+warnings.filterwarnings('ignore', message='"flask_wtf.Form" has been renamed')
+
+
+class ImportSpec(object):
+
+    def __init__(self, table, form, columns, booleans=(), lists=()):
+        self.table = table
+        self.form = form
+        self.columns = columns
+        self.booleans = booleans
+        self.lists = lists
+
+
+SPECS = {
+    'venues': ImportSpec('Venue', VenueForm,
+                         ['name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link', 'genres',
+                          'website', 'seeking_talent', 'seeking_description'],
+                         booleans=['seeking_talent'], lists=['genres']),
+    'artists': ImportSpec('Artist', ArtistForm,
+                          ['name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'genres', 'website',
+                           'seeking_venue', 'seeking_description'],
+                          booleans=['seeking_venue'], lists=['genres']),
+    'shows': ImportSpec('Show', ShowForm, ['artist_id', 'venue_id', 'start_time']),
+}
+
+
+def read_rows(stream, file_format):
+    """Yield (line number, row dict) pairs from a CSV or NDJSON stream."""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, {'__error__': 'Invalid JSON: %s' % e}
+                continue
+            yield line_num, row if isinstance(row, dict) else {'__error__': 'Expected a JSON object'}
+
+
+def _formdata(spec, row):
+    formdata = MultiDict()
+    for column in spec.columns:
+        value = row.get(column)
+        if value is None:
+            continue
+        if column in spec.lists:
+            if isinstance(value, str):
+                value = [item.strip() for item in value.strip('{}').split(',') if item.strip()]
+            formdata.setlist(column, [str(item) for item in value])
+        elif column in spec.booleans:
+            if str(value).strip().lower() in TRUE_VALUES:
+                formdata[column] = 'y'
+        else:
+            formdata[column] = str(value)
+    return formdata
+
+
+def validate_row(spec, row):
+    """Return (values, None) for a valid row or (None, errors)."""
+    if '__error__' in row:
+        return None, {'row': [row['__error__']]}
+
+    form = spec.form(formdata=_formdata(spec, row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+
+    values = {column: getattr(form, column).data for column in spec.columns}
+    if spec.table == 'Show':
+        try:
+            values['artist_id'] = int(values['artist_id'])
+            values['venue_id'] = int(values['venue_id'])
+        except ValueError:
+            return None, {'id': ['artist_id and venue_id must be integers.']}
+    return values, None
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        value = '{%s}' % ','.join('"%s"' % str(item).replace('\\', '\\\\').replace('"', '\\"') for item in value)
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class Importer(object):
+
+    def __init__(self, db, kind, batch_size=1000, use_copy=False, rejects=None):
+        self.db = db
+        self.spec = SPECS[kind]
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.rejects = rejects
+        self.loaded = 0
+        self.rejected = 0
+
+    def reject(self, line_num, row, errors):
+        self.rejected += 1
+        if self.rejects is not None:
+            self.rejects.write(json.dumps({'line': line_num, 'errors': errors, 'row': row}, default=str) + '\n')
+
+    def run(self, rows):
+        batch = []
+        for line_num, row in rows:
+            values, errors = validate_row(self.spec, row)
+            if errors:
+                self.reject(line_num, row, errors)
+                continue
+
+            batch.append((line_num, row, values))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+
+        if batch:
+            self.flush(batch)
+        return self.loaded, self.rejected
+
+    def flush(self, batch):
+        if self.spec.table == 'Show':
+            batch = self.drop_dangling_shows(batch)
+
+        columns = self.spec.columns
+        records = [[values[column] for column in columns] for _, _, values in batch]
+        if not records:
+            return
+
+        cursor = self.db.session.connection().connection.cursor()
+        column_list = ', '.join(columns)
+
+        if self.use_copy:
+            buffer = io.StringIO()
+            for record in records:
+                buffer.write('\t'.join(_copy_value(value) for value in record) + '\n')
+            buffer.seek(0)
+            cursor.copy_expert('COPY "%s" (%s) FROM STDIN' % (self.spec.table, column_list), buffer)
+        else:
+            execute_values(cursor, 'INSERT INTO "%s" (%s) VALUES %%s' % (self.spec.table, column_list),
+                           records, page_size=len(records) or 1)
+
+        self.db.session.commit()
+        self.loaded += len(records)
+
+    def drop_dangling_shows(self, batch):
+        # One lookup per batch instead of a foreign key error on the COPY.
+        venue_ids = {values['venue_id'] for _, _, values in batch}
+        artist_ids = {values['artist_id'] for _, _, values in batch}
+        venues = {id for id, in self.db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+        artists = {id for id, in self.db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+
+        valid = []
+        for line_num, row, values in batch:
+            errors = {}
+            if values['venue_id'] not in venues:
+                errors['venue_id'] = ['Venue %d does not exist.' % values['venue_id']]
+            if values['artist_id'] not in artists:
+                errors['artist_id'] = ['Artist %d does not exist.' % values['artist_id']]
+            if errors:
+                self.reject(line_num, row, errors)
+            else:
+                valid.append((line_num, row, values))
+        return valid
+
+
+def import_file(db, kind, stream, file_format, batch_size=1000, use_copy=False, rejects=None):
+    """Import one file and bring the derived data back in line.
+
+    Returns (loaded, rejected) row counts.
+    """
+    importer = Importer(db, kind, batch_size=batch_size, use_copy=use_copy, rejects=rejects)
+    loaded, rejected = importer.run(read_rows(stream, file_format))
+
+    # The rows went in below the ORM, so neither the Show counter listeners
+    # nor the query cache's write tracking saw them.
+    if kind == 'shows' and loaded:
+        reconcile_show_counts()
+    query_cache.bump(importer.spec.table)
+    return loaded, rejected
@@ -0,0 +1,263 @@
+# ----------------------------------------------------------------------------#
+# Per-request SQL instrumentation.
+# ----------------------------------------------------------------------------#
+
+import json
+import queue
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_PARAM_LISTS = re.compile(r'\(\s*%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+\s*\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Reduce a statement to its shape: literals and IN lists become ``?``."""
+    statement = _PARAM_LISTS.sub('(?)', statement)
+    statement = _LITERALS.sub('?', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestQueries(object):
+    """The statements one request ran and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+# Called with (conn, statement, parameters, executemany, seconds) after
+# every statement; see SlowQueryLog.
+_observers = []
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started_at'].pop()
+    if has_request_context() and 'request_queries' in g:
+        g.request_queries.record(statement, seconds)
+    for observer in _observers:
+        observer(conn, statement, parameters, executemany, seconds)
+
+
+def _handle_error(context):
+    started = context.connection.info.get('query_started_at')
+    if started:
+        started.pop()
+
+
+_listening = False
+
+
+def listen():
+    # Listening on the Engine class covers every engine the process creates,
+    # the app's and the benchmark scripts' alike.
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
+
+
+class QueryInstrumentation(object):
+    """Counts the SQL each request runs and flags repeated statement shapes.
+
+    Debug responses carry ``X-Query-Count``, ``X-Query-Time`` (ms) and
+    ``X-Query-Repeated`` headers; otherwise every request is logged as one
+    JSON line. A shape run ``QUERY_REPEAT_THRESHOLD`` times in one request
+    is the signature of an N+1. A request over its endpoint's budget is
+    logged, or raises :class:`QueryBudgetExceeded` with
+    ``QUERY_BUDGET_STRICT`` so the offending route fails its test.
+
+    Statements a streamed body runs after the headers are sent are not
+    counted.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('QUERY_BUDGET', 10)
+        app.config.setdefault('QUERY_BUDGETS', {})
+        app.config.setdefault('QUERY_BUDGET_STRICT', False)
+        app.config.setdefault('QUERY_REPEAT_THRESHOLD', 3)
+        app.extensions['query_instrumentation'] = self
+
+        listen()
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    @staticmethod
+    def start():
+        g.request_queries = RequestQueries()
+        g.request_started_at = time.perf_counter()
+
+    def budget(self, endpoint):
+        return self.app.config['QUERY_BUDGETS'].get(endpoint, self.app.config['QUERY_BUDGET'])
+
+    def finish(self, response):
+        queries = g.get('request_queries')
+        if queries is None:
+            return response
+
+        config = self.app.config
+        repeated = queries.repeated(config['QUERY_REPEAT_THRESHOLD'])
+        budget = self.budget(request.endpoint)
+        over_budget = budget is not None and queries.count > budget
+
+        if self.app.debug:
+            response.headers['X-Query-Count'] = str(queries.count)
+            response.headers['X-Query-Time'] = '%.1f' % (queries.seconds * 1000)
+            response.headers['X-Query-Repeated'] = str(len(repeated))
+        else:
+            self.app.logger.info(json.dumps({
+                'event': 'request',
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - g.request_started_at) * 1000, 1),
+                'queries': queries.count,
+                'db_ms': round(queries.seconds * 1000, 1),
+                'repeated': [{'count': count, 'statement': shape[:200]} for shape, count in repeated],
+            }))
+
+        for shape, count in repeated:
+            self.app.logger.warning('%s ran the same statement %d times: %s', request.endpoint, count, shape[:500])
+
+        if over_budget:
+            message = '%s ran %d queries, over its budget of %d' % (request.endpoint, queries.count, budget)
+            if config['QUERY_BUDGET_STRICT']:
+                raise QueryBudgetExceeded(message)
+            self.app.logger.warning(message)
+        return response
+
+
+class SlowQueryLog(object):
+    """Logs statements slower than ``SLOW_QUERY_THRESHOLD_MS``, with plans.
+
+    Each entry is a JSON line with the statement, its bound parameters, the
+    Flask endpoint that ran it and, with ``SLOW_QUERY_EXPLAIN``, the output
+    of ``EXPLAIN (ANALYZE off)``. The plan is fetched on a background thread
+    over its own connection, so the slow request is not made slower. A
+    statement shape is logged at most once per ``SLOW_QUERY_LOG_INTERVAL``
+    seconds; the next entry reports how often it recurred in between.
+    """
+
+    def __init__(self, app=None):
+        self.threshold = 0
+        self.explain = True
+        self.interval = 300
+        self.logger = None
+        self._shapes = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=100)
+        self._worker = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', self.threshold) / 1000.0
+        self.explain = app.config.get('SLOW_QUERY_EXPLAIN', self.explain)
+        self.interval = app.config.get('SLOW_QUERY_LOG_INTERVAL', self.interval)
+        self.logger = app.logger
+        app.extensions['slow_query_log'] = self
+
+        if self.threshold > 0 and self.observe not in _observers:
+            listen()
+            _observers.append(self.observe)
+
+    def observe(self, conn, statement, parameters, executemany, seconds):
+        if seconds < self.threshold:
+            return
+
+        shape = statement_shape(statement)
+        now = time.monotonic()
+        with self._lock:
+            last_logged_at, recurred = self._shapes.get(shape, (None, 0))
+            if last_logged_at is not None and now - last_logged_at < self.interval:
+                self._shapes[shape] = (last_logged_at, recurred + 1)
+                return
+            self._shapes[shape] = (now, 0)
+            if len(self._shapes) > 1000:
+                horizon = now - self.interval
+                self._shapes = {key: value for key, value in self._shapes.items() if value[0] > horizon}
+
+        entry = {
+            'event': 'slow_query',
+            'duration_ms': round(seconds * 1000, 1),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'statement': statement,
+            'parameters': repr(parameters)[:1000],
+            'recurred': recurred,
+        }
+        explainable = not executemany and statement.lstrip().split(None, 1)[0].upper() in \
+            ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+        if not (self.explain and explainable):
+            self.logger.warning(json.dumps(entry, default=str))
+            return
+
+        try:
+            self._queue.put_nowait((conn.engine, statement, parameters, entry))
+        except queue.Full:
+            entry['plan'] = None
+            self.logger.warning(json.dumps(entry, default=str))
+            return
+
+        if self._worker is None or not self._worker.is_alive():
+            # Started on first use, so it runs in the worker process that
+            # needs it rather than in a pre-fork master.
+            self._worker = threading.Thread(target=self._explain_forever, name='slow-query-explain', daemon=True)
+            self._worker.start()
+
+    def _explain_forever(self):
+        while True:
+            engine, statement, parameters, entry = self._queue.get()
+            try:
+                entry['plan'] = self.plan(engine, statement, parameters)
+            except Exception as e:
+                entry['plan'] = None
+                entry['explain_error'] = str(e)
+            self.logger.warning(json.dumps(entry, default=str))
+
+    @staticmethod
+    def plan(engine, statement, parameters):
+        # Raw DBAPI connection: no engine events, so EXPLAIN is neither timed
+        # nor fed back into this log.
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SET LOCAL statement_timeout = 5000')
+            cursor.execute('EXPLAIN (ANALYZE off) ' + statement, parameters)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            connection.rollback()
+            connection.close()
@@ -0,0 +1,120 @@
+# ----------------------------------------------------------------------------#
+# Prometheus metrics.
+# ----------------------------------------------------------------------------#
+#
+# With several worker processes, point PROMETHEUS_MULTIPROC_DIR at an empty
+# directory before the workers start. Each worker then writes its samples to
+# memory-mapped files there and /metrics aggregates every worker's files.
+
+import os
+import threading
+import time
+
+from flask import Response, before_render_template, g, request, template_rendered
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+REQUEST_LATENCY = Histogram('fyyur_request_duration_seconds', 'Request latency.',
+                            ['endpoint', 'method', 'status'])
+REQUEST_DB_TIME = Histogram('fyyur_request_db_seconds', 'Time spent in SQL per request.', ['endpoint'])
+REQUEST_QUERIES = Histogram('fyyur_request_queries', 'SQL statements per request.', ['endpoint'],
+                            buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+TEMPLATE_RENDER_TIME = Histogram('fyyur_template_render_seconds', 'Template render time.', ['template'])
+
+POOL_CONNECTIONS = Gauge('fyyur_db_pool_connections', 'Connections held by the pool.', ['state'],
+                         multiprocess_mode='livesum')
+POOL_CHECKOUTS = Counter('fyyur_db_pool_checkouts', 'Connection checkouts.')
+POOL_TIMEOUTS = Counter('fyyur_db_pool_timeouts', 'Checkouts that timed out waiting for a connection.')
+POOL_WAIT = Counter('fyyur_db_pool_wait_seconds', 'Time spent waiting for a connection.')
+
+CACHE_HITS = Counter('fyyur_cache_hits', 'Cache hits.', ['cache'])
+CACHE_MISSES = Counter('fyyur_cache_misses', 'Cache misses.', ['cache'])
+
+
+class Metrics(object):
+    """Request, database, template, pool and cache metrics for /metrics.
+
+    Latency is labelled by endpoint name rather than path so ids do not
+    multiply the series. Pool and cache counters are read from the objects
+    that already keep them and published as deltas after each request.
+    """
+
+    def __init__(self, app=None, db=None, page_cache=None, query_cache=None, fragment_cache=None, pool_stats=None):
+        self.db = db
+        self.caches = {'page': page_cache, 'query': query_cache, 'fragment': fragment_cache}
+        self.pool_stats = pool_stats
+        self._published = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        before_render_template.connect(self.template_started, app)
+        template_rendered.connect(self.template_finished, app)
+
+    @staticmethod
+    def start():
+        g.metrics_started_at = time.perf_counter()
+
+    def finish(self, response):
+        started = g.get('metrics_started_at')
+        if started is None:
+            return response
+
+        endpoint = request.endpoint or 'none'
+        REQUEST_LATENCY.labels(endpoint, request.method, response.status_code).observe(time.perf_counter() - started)
+        queries = g.get('request_queries')
+        if queries is not None:
+            REQUEST_DB_TIME.labels(endpoint).observe(queries.seconds)
+            REQUEST_QUERIES.labels(endpoint).observe(queries.count)
+
+        self.publish()
+        return response
+
+    @staticmethod
+    def template_started(app, template, context, **extra):
+        g.setdefault('template_started_at', []).append(time.perf_counter())
+
+    @staticmethod
+    def template_finished(app, template, context, **extra):
+        started = g.get('template_started_at')
+        if started:
+            TEMPLATE_RENDER_TIME.labels(template.name or 'string').observe(time.perf_counter() - started.pop())
+
+    def _increase(self, key, counter, value):
+        # Add how far `value` moved since the last publish.
+        previous = self._published.get(key, 0)
+        if value > previous:
+            counter.inc(value - previous)
+        self._published[key] = value
+
+    def publish(self):
+        with self._lock:
+            for name, cache in self.caches.items():
+                if cache is not None:
+                    self._increase(('hits', name), CACHE_HITS.labels(name), cache.hits)
+                    self._increase(('misses', name), CACHE_MISSES.labels(name), cache.misses)
+
+            if self.pool_stats is None:
+                return
+            stats = self.pool_stats.snapshot(self.db.engine.pool if self.db is not None else None)
+            self._increase('checkouts', POOL_CHECKOUTS, stats['checkouts'])
+            self._increase('timeouts', POOL_TIMEOUTS, stats['timeouts'])
+            self._increase('wait', POOL_WAIT, stats['wait_seconds_total'])
+            if 'checked_out' in stats:
+                POOL_CONNECTIONS.labels('checked_out').set(stats['checked_out'])
+                POOL_CONNECTIONS.labels('checked_in').set(stats['checked_in'])
+                POOL_CONNECTIONS.labels('overflow').set(max(stats['overflow'], 0))
+
+    def response(self):
+        self.publish()
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
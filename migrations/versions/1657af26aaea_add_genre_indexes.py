@@ -0,0 +1,33 @@
+"""add genre indexes
+
+Revision ID: 1657af26aaea
+Revises: 1ac4c7490810
+Create Date: 2026-10-18 16:41:09.215730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1657af26aaea'
+down_revision = '1ac4c7490810'
+branch_labels = None
+depends_on = None
+
+# GIN indexes over the genre arrays serve the @> and && filters on /venues
+# and /artists. Built concurrently, like the show indexes.
+TABLES = ['Venue', 'Artist']
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index('ix_%s_genres' % table, table, ['genres'], unique=False, postgresql_using='gin',
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in reversed(TABLES):
+            op.drop_index('ix_%s_genres' % table, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,40 @@
+"""add updated_at
+
+Revision ID: 1ac4c7490810
+Revises: 954ed2929e4c
+Create Date: 2026-10-18 14:12:37.481093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1ac4c7490810'
+down_revision = '954ed2929e4c'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Venue', 'Artist', 'Show']
+
+
+def upgrade():
+    # LOCALTIMESTAMP is evaluated once for the ALTER, so existing rows are
+    # not rewritten.
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text('LOCALTIMESTAMP')))
+
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index('ix_%s_updated_at' % table, table, ['updated_at'], unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in reversed(TABLES):
+            op.drop_index('ix_%s_updated_at' % table, table_name=table, postgresql_concurrently=True)
+
+    for table in reversed(TABLES):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,36 @@
+"""add name trigram indexes
+
+Revision ID: 954ed2929e4c
+Revises: e268dd3729b5
+Create Date: 2026-10-18 11:27:10.442915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '954ed2929e4c'
+down_revision = 'e268dd3729b5'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_Venue_name_trgm', 'Venue'),
+    ('ix_Artist_name_trgm', 'Artist'),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(name, table, ['name'], unique=False, postgresql_concurrently=True,
+                            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
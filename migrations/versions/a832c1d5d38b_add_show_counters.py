@@ -0,0 +1,51 @@
+"""add show counters
+
+Revision ID: a832c1d5d38b
+Revises: d53358a0adff
+Create Date: 2026-10-18 09:12:41.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a832c1d5d38b'
+down_revision = 'd53358a0adff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowRollover',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_over_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.add_column('Artist', sa.Column('num_past_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Venue', sa.Column('num_past_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Venue', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+
+    # Seed the rollover watermark and backfill the counters against it.
+    op.execute('INSERT INTO "ShowRollover" (rolled_over_at) VALUES (LOCALTIMESTAMP)')
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(f'''
+            UPDATE "{table}" SET
+                num_upcoming_shows = (
+                    SELECT count(*) FROM "Show", "ShowRollover"
+                    WHERE "Show".{key} = "{table}".id AND "Show".start_time > "ShowRollover".rolled_over_at
+                ),
+                num_past_shows = (
+                    SELECT count(*) FROM "Show", "ShowRollover"
+                    WHERE "Show".{key} = "{table}".id AND "Show".start_time <= "ShowRollover".rolled_over_at
+                )
+        ''')
+
+
+def downgrade():
+    op.drop_column('Venue', 'num_upcoming_shows')
+    op.drop_column('Venue', 'num_past_shows')
+    op.drop_column('Artist', 'num_upcoming_shows')
+    op.drop_column('Artist', 'num_past_shows')
+    op.drop_table('ShowRollover')
@@ -0,0 +1,36 @@
+"""add show indexes
+
+Revision ID: e268dd3729b5
+Revises: a832c1d5d38b
+Create Date: 2026-10-18 10:03:55.907114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e268dd3729b5'
+down_revision = 'a832c1d5d38b'
+branch_labels = None
+depends_on = None
+
+# CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction, so each
+# statement runs in an autocommit block and writers to "Show" are never locked.
+INDEXES = [
+    ('ix_Show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_Show_start_time', ['start_time']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'Show', columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, columns in reversed(INDEXES):
+            op.drop_index(name, table_name='Show', postgresql_concurrently=True)
@@ -2,16 +2,22 @@
 # Models.
 # ----------------------------------------------------------------------------#
 import datetime
+import itertools
 
-from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import ARRAY
 
-from app import db
+from extensions import db, query_cache
 
 
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_updated_at', 'updated_at'),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -21,10 +27,16 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(ARRAY(db.String))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String())
     website = db.Column(db.String(120))
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # onupdate also applies to the bulk counter UPDATEs below, so adding,
+    # deleting or rolling over a show touches its venue and artist too.
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.datetime.now,
+                           onupdate=datetime.datetime.now, server_default=db.text('LOCALTIMESTAMP'))
     shows = db.relationship('Show', backref='venue', lazy=True, cascade="all, delete")
 
     def __repr__(self):
@@ -38,21 +50,69 @@ class Venue(db.Model):
         }
         return venue
 
-    def get_upcoming_shows_count(self):
+    @staticmethod
+    @query_cache.cached('Venue', 'Show')
+    def get_areas(genres=(), match='all'):
+        # One query for every venue and its upcoming show counter, then bucket
+        # the rows by city/state in Python.
+        query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.num_upcoming_shows,
+                                 Venue.updated_at)
+        if genres:
+            query = query.filter(genre_filter(Venue, genres, match))
+        rows = query.order_by(Venue.city, Venue.state, Venue.id).all()
+
+        areas = []
+        for (city, state), venues in itertools.groupby(rows, key=lambda row: (row.city, row.state)):
+            areas.append({
+                'city': city,
+                'state': state,
+                'venues': [{
+                    "id": venue.id,
+                    "name": venue.name,
+                    "num_upcoming_shows": venue.num_upcoming_shows,
+                    "updated_at": venue.updated_at,
+                } for venue in venues],
+            })
+        return areas
+
+    @query_cache.cached('Show', 'Artist')
+    def get_shows(self):
+        # Every show at this venue with its artist in one query, split into
+        # upcoming (soonest first) and past (most recent first) in Python.
         now = datetime.datetime.now()
-        upcoming_shows_query = db.session.query(Show) \
+        rows = db.session.query(Show.id, Show.start_time, Show.updated_at,
+                                Artist.id, Artist.name, Artist.image_link, Artist.updated_at) \
+            .join(Artist, Artist.id == Show.artist_id) \
             .filter(Show.venue_id == self.id) \
-            .filter(Show.start_time > now) \
+            .filter(Show.start_time.isnot(None)) \
+            .order_by(Show.start_time, Show.id) \
             .all()
-        return len(upcoming_shows_query)
+
+        past_shows = []
+        upcoming_shows = []
+        for show_id, start_time, updated_at, artist_id, artist_name, artist_image_link, artist_updated_at in rows:
+            show = {
+                "id": show_id,
+                "artist_id": artist_id,
+                "artist_name": artist_name,
+                "artist_image_link": artist_image_link,
+                "start_time": start_time,
+                "updated_at": updated_at,
+                "artist_updated_at": artist_updated_at,
+            }
+            if start_time > now:
+                upcoming_shows.append(show)
+            elif start_time < now:
+                past_shows.append(show)
+
+        past_shows.reverse()
+        return past_shows, upcoming_shows
+
+    def get_upcoming_shows_count(self):
+        return self.num_upcoming_shows
 
     def get_past_shows_count(self):
-        now = datetime.datetime.now()
-        upcoming_shows_query = db.session.query(Show) \
-            .filter(Show.venue_id == self.id) \
-            .filter(Show.start_time < now) \
-            .all()
-        return len(upcoming_shows_query)
+        return self.num_past_shows
 
     @property
     def search(self):
@@ -65,38 +125,70 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_updated_at', 'updated_at'),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(ARRAY(db.String))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String())
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.datetime.now,
+                           onupdate=datetime.datetime.now, server_default=db.text('LOCALTIMESTAMP'))
     shows = db.relationship('Show', backref='artist', lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f'<Venue {self.id} {self.name}>'
 
-    def get_upcoming_shows_count(self):
+    @query_cache.cached('Show', 'Venue')
+    def get_shows(self):
+        # Every show by this artist with its venue in one query, split into
+        # upcoming (soonest first) and past (most recent first) in Python.
         now = datetime.datetime.now()
-        upcoming_shows_query = db.session.query(Show) \
+        rows = db.session.query(Show.id, Show.start_time, Show.updated_at,
+                                Venue.id, Venue.name, Venue.image_link, Venue.updated_at) \
+            .join(Venue, Venue.id == Show.venue_id) \
             .filter(Show.artist_id == self.id) \
-            .filter(Show.start_time > now) \
+            .filter(Show.start_time.isnot(None)) \
+            .order_by(Show.start_time, Show.id) \
             .all()
-        return len(upcoming_shows_query)
+
+        past_shows = []
+        upcoming_shows = []
+        for show_id, start_time, updated_at, venue_id, venue_name, venue_image_link, venue_updated_at in rows:
+            show = {
+                "id": show_id,
+                "venue_id": venue_id,
+                "venue_name": venue_name,
+                "venue_image_link": venue_image_link,
+                "start_time": start_time,
+                "updated_at": updated_at,
+                "venue_updated_at": venue_updated_at,
+            }
+            if start_time > now:
+                upcoming_shows.append(show)
+            elif start_time < now:
+                past_shows.append(show)
+
+        past_shows.reverse()
+        return past_shows, upcoming_shows
+
+    def get_upcoming_shows_count(self):
+        return self.num_upcoming_shows
 
     def get_past_shows_count(self):
-        now = datetime.datetime.now()
-        upcoming_shows_query = db.session.query(Show) \
-            .filter(Show.artist_id == self.id) \
-            .filter(Show.start_time < now) \
-            .all()
-        return len(upcoming_shows_query)
+        return self.num_past_shows
 
     @property
     def search(self):
@@ -109,11 +201,309 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time', 'start_time'),
+        db.Index('ix_Show_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     start_time = db.Column(db.DateTime())
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.datetime.now,
+                           onupdate=datetime.datetime.now, server_default=db.text('LOCALTIMESTAMP'))
 
     def __repr__(self):
         return f'<Venue {self.id}>'
+
+    @staticmethod
+    def encode_cursor(show):
+        return f"{show['start_time'].isoformat()}_{show['id']}"
+
+    @staticmethod
+    def decode_cursor(cursor):
+        # Raises ValueError for anything encode_cursor() could not have made.
+        start_time, _, show_id = cursor.rpartition('_')
+        return datetime.datetime.fromisoformat(start_time), int(show_id)
+
+    @staticmethod
+    @query_cache.cached('Show', 'Venue', 'Artist')
+    def get_page(after=None, before=None, per_page=30):
+        # Keyset pagination over (start_time, id), newest first. `after` walks
+        # towards older shows and `before` back towards newer ones; both are
+        # (start_time, id) pairs taken from decode_cursor().
+        shows = db.session.query(Show.id, Show.start_time, Show.updated_at,
+                                 Venue.id.label('venue_id'), Venue.name.label('venue_name'),
+                                 Venue.updated_at.label('venue_updated_at'),
+                                 Artist.id.label('artist_id'), Artist.name.label('artist_name'),
+                                 Artist.image_link.label('artist_image_link'),
+                                 Artist.updated_at.label('artist_updated_at')) \
+            .join(Venue, Venue.id == Show.venue_id) \
+            .join(Artist, Artist.id == Show.artist_id) \
+            .filter(Show.start_time.isnot(None))
+        key = db.tuple_(Show.start_time, Show.id)
+
+        if before is not None:
+            rows = shows.filter(key > before) \
+                .order_by(Show.start_time.asc(), Show.id.asc()) \
+                .limit(per_page + 1) \
+                .all()
+            has_newer, has_older = len(rows) > per_page, True
+            rows = rows[:per_page][::-1]
+        else:
+            if after is not None:
+                shows = shows.filter(key < after)
+            rows = shows.order_by(Show.start_time.desc(), Show.id.desc()) \
+                .limit(per_page + 1) \
+                .all()
+            has_newer, has_older = after is not None, len(rows) > per_page
+            rows = rows[:per_page]
+
+        rows = [row._asdict() for row in rows]
+        return {
+            'shows': rows,
+            'next_cursor': Show.encode_cursor(rows[-1]) if rows and has_older else None,
+            'prev_cursor': Show.encode_cursor(rows[0]) if rows and has_newer else None,
+        }
+
+
+class ShowRollover(db.Model):
+    # Single row holding the instant the show counters were last rolled over:
+    # a show counts as upcoming while its start_time is after rolled_over_at.
+    __tablename__ = 'ShowRollover'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_over_at = db.Column(db.DateTime(), nullable=False)
+
+    def __repr__(self):
+        return f'<ShowRollover {self.rolled_over_at}>'
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+@query_cache.cached('Venue', 'Artist', 'Show')
+def search_by_name(model, search_term, page=1, per_page=20):
+    # Case-insensitive substring matches plus trigram-similar names (typos),
+    # best match first. Both predicates are served by the name's pg_trgm GIN
+    # index, and the total match count rides along as a window aggregate.
+    pattern = '%' + search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    page = max(page, 1)
+
+    # '%%' is pg_trgm's similarity operator, escaped for psycopg2.
+    matches = db.session.query(model.id, model.name, model.num_upcoming_shows) \
+        .filter(db.or_(model.name.ilike(pattern, escape='\\'), model.name.op('%%')(search_term)))
+
+    rows = matches.add_columns(db.func.count().over().label('total')) \
+        .order_by(db.func.similarity(model.name, search_term).desc(), model.name, model.id) \
+        .limit(per_page) \
+        .offset((page - 1) * per_page) \
+        .all()
+
+    if rows:
+        count = rows[0].total
+    else:
+        # Past the last page the window has no rows to ride on.
+        count = matches.count() if page > 1 else 0
+    return {
+        "count": count,
+        "page": page,
+        "pages": -(-count // per_page),
+        "data": [{
+            'id': row.id,
+            'name': row.name,
+            "num_upcoming_shows": row.num_upcoming_shows,
+        } for row in rows],
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Genres.
+# ----------------------------------------------------------------------------#
+
+def genre_filter(model, genres, match='all'):
+    # @> (has every genre) or && (has any of them); both are served by the
+    # genres GIN index.
+    if match == 'any':
+        return model.genres.overlap(list(genres))
+    return model.genres.contains(list(genres))
+
+
+@query_cache.cached('Venue', 'Artist')
+def genre_counts(model, genres=(), match='all'):
+    """Return {genre: count} over the rows the same filter would list."""
+    genre = db.func.unnest(model.genres).label('genre')
+    query = db.session.query(genre)
+    if genres:
+        query = query.filter(genre_filter(model, genres, match))
+    rows = query.subquery()
+    return dict(db.session.query(rows.c.genre, db.func.count()).group_by(rows.c.genre).all())
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+def _adjust_show_counts(connection, changes):
+    # `changes` is a list of (show, +1 or -1). The deltas are summed per
+    # venue, artist and counter and applied with one executemany UPDATE per
+    # table and counter, however many shows a flush added or deleted.
+
+    # Hold the rollover row for the rest of the transaction so a concurrent
+    # rollover cannot move the watermark past these shows before we commit.
+    rollover = ShowRollover.__table__
+    rolled_over_at = connection.execute(
+        db.select([rollover.c.rolled_over_at]).with_for_update(read=True)
+    ).scalar()
+
+    deltas = {}
+    for show, delta in changes:
+        if rolled_over_at is None or show.start_time > rolled_over_at:
+            counter = 'num_upcoming_shows'
+        else:
+            counter = 'num_past_shows'
+        for model, key in ((Venue, show.venue_id), (Artist, show.artist_id)):
+            by_key = deltas.setdefault((model, counter), {})
+            by_key[key] = by_key.get(key, 0) + delta
+
+    for (model, counter), by_key in deltas.items():
+        rows = [{'key': key, 'delta': delta} for key, delta in by_key.items() if delta]
+        if not rows:
+            continue
+        table = model.__table__
+        connection.execute(
+            table.update()
+                .where(table.c.id == db.bindparam('key'))
+                .values({counter: table.c[counter] + db.bindparam('delta')}),
+            rows
+        )
+
+
+@event.listens_for(db.session, 'after_flush')
+def update_show_counts(session, flush_context):
+    # session.new and session.deleted still hold what this flush wrote,
+    # including shows deleted by a venue's cascade.
+    changes = [(show, 1) for show in session.new if isinstance(show, Show)] + \
+              [(show, -1) for show in session.deleted if isinstance(show, Show)]
+    changes = [(show, delta) for show, delta in changes if show.start_time is not None]
+    if changes:
+        _adjust_show_counts(session.connection(), changes)
+
+
+def rollover_show_counts(now=None):
+    # Moves every show that started since the last rollover from the upcoming
+    # to the past counter of its venue and artist. Meant to run on a schedule.
+    now = now or datetime.datetime.now()
+    rollover = ShowRollover.query.with_for_update().one()
+
+    started = Show.query \
+        .filter(Show.start_time > rollover.rolled_over_at) \
+        .filter(Show.start_time <= now) \
+        .count()
+
+    for model, key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        started_shows = db.session.query(key.label('id'), db.func.count(Show.id).label('count')) \
+            .filter(Show.start_time > rollover.rolled_over_at) \
+            .filter(Show.start_time <= now) \
+            .group_by(key) \
+            .subquery()
+
+        db.session.query(model) \
+            .filter(model.id == started_shows.c.id) \
+            .update({
+                model.num_upcoming_shows: model.num_upcoming_shows - started_shows.c.count,
+                model.num_past_shows: model.num_past_shows + started_shows.c.count,
+            }, synchronize_session=False)
+
+    rollover.rolled_over_at = now
+    db.session.commit()
+    return started
+
+
+def reconcile_show_counts(now=None):
+    # Recomputes every counter from the Show table in bulk and resets the
+    # rollover watermark to `now`.
+    now = now or datetime.datetime.now()
+    rollover = ShowRollover.query.with_for_update().one()
+
+    for model, key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        upcoming = db.session.query(db.func.count(Show.id)) \
+            .filter(key == model.id) \
+            .filter(Show.start_time > now) \
+            .as_scalar()
+        past = db.session.query(db.func.count(Show.id)) \
+            .filter(key == model.id) \
+            .filter(Show.start_time <= now) \
+            .as_scalar()
+
+        # Only rows that drifted are written, so their updated_at (and the
+        # validators built on it) stay put otherwise.
+        db.session.query(model) \
+            .filter(db.or_(model.num_upcoming_shows != upcoming, model.num_past_shows != past)) \
+            .update({
+                model.num_upcoming_shows: upcoming,
+                model.num_past_shows: past,
+            }, synchronize_session=False)
+
+    rollover.rolled_over_at = now
+    db.session.commit()
+
+
+# ----------------------------------------------------------------------------#
+# Validators.
+# ----------------------------------------------------------------------------#
+#
+# Each returns (last_modified, token) for everything its page displays,
+# from a single aggregate query, or None when the page would be a 404.
+# See cache.conditional().
+
+def venues_validator():
+    # Counter changes touch updated_at, and a delete changes the count.
+    updated_at, count = db.session.query(db.func.max(Venue.updated_at), db.func.count(Venue.id)).one()
+    return updated_at, ('venues', updated_at, count)
+
+
+def artists_validator():
+    updated_at, count = db.session.query(db.func.max(Artist.updated_at), db.func.count(Artist.id)).one()
+    return updated_at, ('artists', updated_at, count)
+
+
+def _profile_validator(model, key, other, other_key, id):
+    # The profile, the other side of each of its shows, its show count and
+    # the latest show that has started: pages split shows into upcoming and
+    # past as they start, not only when something is written.
+    now = datetime.datetime.now()
+    row = db.session.query(model.updated_at,
+                           db.func.max(other.updated_at),
+                           db.func.count(Show.id),
+                           db.func.max(Show.start_time).filter(Show.start_time <= now)) \
+        .outerjoin(Show, key == model.id) \
+        .outerjoin(other, other.id == other_key) \
+        .filter(model.id == id) \
+        .group_by(model.id) \
+        .first()
+    if row is None:
+        return None
+
+    last_modified = max(value for value in (row[0], row[1], row[3]) if value is not None)
+    return last_modified, (model.__tablename__, id) + tuple(row)
+
+
+def venue_validator(venue_id):
+    return _profile_validator(Venue, Show.venue_id, Artist, Show.artist_id, venue_id)
+
+
+def artist_validator(artist_id):
+    return _profile_validator(Artist, Show.artist_id, Venue, Show.venue_id, artist_id)
+
+
+def shows_validator():
+    # Deleting a show touches its venue and artist, so the three maxima,
+    # each an index lookup, also notice deletes without counting "Show".
+    row = db.session.query(*[db.session.query(db.func.max(model.updated_at)).as_scalar()
+                             for model in (Show, Venue, Artist)]).one()
+    timestamps = [value for value in row if value is not None]
+    return max(timestamps) if timestamps else None, ('shows',) + tuple(row)
@@ -0,0 +1,119 @@
+# ----------------------------------------------------------------------------#
+# Template bytecode cache and warmup.
+# ----------------------------------------------------------------------------#
+#
+# Left alone, every worker compiles each template the first time a request
+# uses it, so the first requests after a deploy are slow. The bytecode cache
+# lets workers load templates that another worker, or an earlier boot,
+# already compiled. The warmup compiles and renders every template when the
+# app is built, so with a preloaded app the workers fork with all of it done.
+
+import datetime
+import os
+import tempfile
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+from forms import ArtistForm, Genre, ShowForm, VenueForm
+
+
+class AtomicFileSystemBytecodeCache(FileSystemBytecodeCache):
+    """FileSystemBytecodeCache that writes each file aside and renames it.
+
+    Jinja 2 writes cache files in place, so a worker booting alongside
+    another could read a file that is still being written.
+    """
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix=os.path.basename(filename), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.replace(path, filename)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+
+def init_templates(app):
+    if not app.config.get('TEMPLATE_BYTECODE_CACHE'):
+        return
+    directory = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # With no directory Jinja picks a private one under the system temp dir.
+    app.jinja_env.bytecode_cache = AtomicFileSystemBytecodeCache(directory)
+
+
+def sample_context(name):
+    """Made-up values for every variable the templates use."""
+    show = {
+        'venue_id': 1, 'venue_name': 'Sample Venue', 'venue_image_link': '',
+        'artist_id': 1, 'artist_name': 'Sample Artist', 'artist_image_link': '',
+        'start_time': datetime.datetime(2030, 1, 1, 20, 0),
+    }
+    profile = {
+        'id': 1, 'name': 'Sample', 'genres': [Genre.Jazz], 'address': '', 'city': 'City', 'state': 'NY',
+        'phone': '', 'website': '', 'facebook_link': '', 'image_link': '',
+        'seeking_talent': True, 'seeking_venue': True, 'seeking_description': '',
+        'past_shows': [show], 'upcoming_shows': [show], 'past_shows_count': 1, 'upcoming_shows_count': 1,
+    }
+    summary = {'id': 1, 'name': 'Sample', 'num_upcoming_shows': 1}
+
+    if 'artist' in name:
+        form = ArtistForm()
+    elif 'show' in name:
+        form = ShowForm()
+    else:
+        form = VenueForm()
+    return {
+        'venue': profile, 'artist': profile, 'form': form,
+        'areas': [{'city': 'City', 'state': 'NY', 'venues': [summary]}],
+        'genres': ('Jazz',), 'match': 'all',
+        'facets': [{'name': 'Jazz', 'label': 'Jazz', 'count': 1, 'selected': True, 'url': '/'}],
+        'artists': [summary],
+        'shows': [show], 'next_cursor': 'next', 'prev_cursor': 'prev',
+        'results': {'count': 1, 'data': [summary], 'page': 1, 'pages': 1}, 'search_term': 'sample',
+    }
+
+
+def warm_templates(app):
+    """Compile every template and render each once with sample data.
+
+    Returns (name, load seconds, render seconds, error) per template. Load
+    time is a compile, or a bytecode cache read when the cache has it.
+    Rendering also primes the datetime filter's parsed patterns.
+    """
+    env = app.jinja_env
+    names = sorted(env.list_templates(extensions=['html']))
+    # Everything is loaded before anything is rendered, so a layout's compile
+    # is not billed to the first page that extends it.
+    loaded = {}
+    for name in names:
+        started = time.perf_counter()
+        env.get_template(name)
+        loaded[name] = time.perf_counter() - started
+
+    timings = []
+    # Sample tiles must not end up in the fragment cache.
+    fragment_cache = getattr(env, 'fragment_cache', None)
+    env.fragment_cache = None
+    try:
+        with app.test_request_context('/'):
+            for name in names:
+                context = sample_context(name)
+                started = time.perf_counter()
+                try:
+                    env.get_template(name).render(context)
+                    rendered, error = time.perf_counter() - started, None
+                except Exception as e:
+                    rendered, error = None, '%s: %s' % (type(e).__name__, e)
+                timings.append((name, loaded[name], rendered, error))
+    finally:
+        env.fragment_cache = fragment_cache
+
+    # The templates only ask for the 'full' format; prime the default too.
+    env.filters['datetime'](datetime.datetime(2030, 1, 1, 20, 0))
+    return timings
@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------------#
+# Test fixtures.
+# ----------------------------------------------------------------------------#
+#
+# The tests run against the scratch PostgreSQL database named by
+# TEST_DATABASE_URL, which is emptied before every test, and are skipped
+# without one. The schema is created on first use and needs pg_trgm.
+
+import datetime
+import os
+
+import pytest
+
+from app import create_app
+from extensions import db, fragment_cache, page_cache
+from models import ShowRollover
+
+TEST_CONFIG = {
+    'TESTING': True,
+    'TEMPLATE_WARMUP': False,
+    'QUERY_BUDGET_STRICT': True,
+    'SLOW_QUERY_THRESHOLD_MS': 0,
+}
+
+
+@pytest.fixture(scope='session')
+def database_url():
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    return url
+
+
+@pytest.fixture
+def make_app(database_url):
+    """Return a factory for apps on the test database, with config overrides.
+
+    The first app a test builds empties the database and the in-process
+    caches; later ones share the data, to compare settings.
+    """
+    contexts = []
+
+    def make_app(**config):
+        app = create_app(dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI=database_url, **config))
+        context = app.app_context()
+        context.push()
+        if not contexts:
+            reset_database()
+            page_cache.clear()
+            fragment_cache.clear()
+        contexts.append((app, context))
+        return app
+
+    yield make_app
+
+    for app, context in reversed(contexts):
+        db.session.remove()
+        db.get_engine(app).dispose()
+        context.pop()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def reset_database():
+    if not db.engine.has_table('Venue'):
+        db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        db.session.commit()
+        db.create_all()
+    db.session.execute('TRUNCATE "Show", "Venue", "Artist", "ShowRollover" RESTART IDENTITY CASCADE')
+    db.session.add(ShowRollover(rolled_over_at=datetime.datetime.now()))
+    db.session.commit()
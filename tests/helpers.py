@@ -0,0 +1,70 @@
+# ----------------------------------------------------------------------------#
+# Test helpers.
+# ----------------------------------------------------------------------------#
+
+import contextlib
+import datetime
+import itertools
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Artist, Show, Venue
+
+_numbers = itertools.count(1)
+
+
+def add_venue(**fields):
+    number = next(_numbers)
+    venue = Venue(**dict({
+        'name': 'Venue %d' % number,
+        'city': 'San Francisco',
+        'state': 'CA',
+        'address': '%d Main St' % number,
+        'phone': '415-555-0100',
+        'genres': ['Jazz'],
+        'seeking_talent': False,
+    }, **fields))
+    db.session.add(venue)
+    db.session.commit()
+    return venue
+
+
+def add_artist(**fields):
+    number = next(_numbers)
+    artist = Artist(**dict({
+        'name': 'Artist %d' % number,
+        'city': 'San Francisco',
+        'state': 'CA',
+        'phone': '415-555-0100',
+        'genres': ['Jazz'],
+        'seeking_venue': False,
+    }, **fields))
+    db.session.add(artist)
+    db.session.commit()
+    return artist
+
+
+def add_show(venue, artist, days=1):
+    """Add a show starting ``days`` from now, in the past when negative."""
+    show = Show(venue_id=venue.id, artist_id=artist.id,
+                start_time=datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=days))
+    db.session.add(show)
+    db.session.commit()
+    return show
+
+
+@contextlib.contextmanager
+def count_queries():
+    """Collect the SQL statements run on the engine inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
@@ -0,0 +1,21 @@
+from benchmarks.seed import seed
+from extensions import db
+from tests.helpers import count_queries
+
+UNCACHED = {'PAGE_CACHE_ENABLED': False, 'QUERY_CACHE_URL': None, 'FRAGMENT_CACHE_ENABLED': False}
+
+
+def test_venues_query_count_does_not_grow_with_data(make_app):
+    app = make_app(**UNCACHED)
+    client = app.test_client()
+
+    counts = []
+    for venues in (20, 200):
+        seed(db, venues=venues, artists=venues, shows=venues * 10, cities=venues // 4)
+        with count_queries() as statements:
+            response = client.get('/venues')
+        assert response.status_code == 200
+        assert b'Venue %d' % venues in response.data
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]